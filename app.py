@@ -1,12 +1,18 @@
 import streamlit as st
-from google import genai
 import base64
 import json
-import requests
-import streamlit.components.v1 as components
 import os
 import time
-from google.genai.types import Part
+import prompt_cache
+import render
+import runtime
+import state_store
+
+# 重いモジュールは初回利用時まで読み込まない（runtime.FAST_START）
+genai_types = runtime.lazy_import("google.genai.types")
+
+# 描画ペイロードの計測（YUKKI_RENDER_PROFILE=1 のときだけ有効）
+render.start_profile()
 
 # =========================================
 #  システムプロンプト
@@ -72,8 +78,8 @@ st.set_page_config(
 )
 
 # カスタム CSS でサイドバーの幅固定、リサイズバー、水平スクロールを制御
-st.markdown(f"""
-<style>
+# （キャッシュに載らない大きさの CSS は、render.stylesheet がセッションごとに1度だけページに登録する）
+render.stylesheet("app", f"""
 /* Streamlitヘッダーを非表示 */
 header {{ visibility: hidden; }}
 
@@ -104,28 +110,43 @@ header {{ visibility: hidden; }}
     align-items: center;
     justify-content: flex-start;
 }}
-</style>
-""", unsafe_allow_html=True)
+""")
 
-# ---- セッション初期化 ----
-if "client" not in st.session_state:
-    st.session_state.client = genai.Client(api_key=API_KEY) if API_KEY else None
+# ---- チャットセッション取得 ----
+def get_chat():
+    """保存済みの履歴からチャットセッションを作って返す（クライアントはプロセス全体で共有）
 
-if "chat" not in st.session_state:
+    どのワーカーでも続きを処理できるよう、またプロンプトキャッシュの参照先を
+    会話の長さに合わせて切り替えられるよう、送信のたびに作り直す。
+    """
+    st.session_state.client = runtime.get_client(API_KEY)
     if st.session_state.client:
         config = {
             "system_instruction": SYSTEM_PROMPT,
             "temperature": 0.2
         }
-        st.session_state.chat = st.session_state.client.chats.create(
-            model="gemini-2.5-flash",
-            config=config
+        # SYSTEM_PROMPT と会話の前半はコンテキストキャッシュから参照する
+        st.session_state.chat = prompt_cache.create_chat(
+            st.session_state.client,
+            "gemini-2.5-flash",
+            config,
+            history=conv.load_history(),
+            conversation_id=conv.id
         )
     else:
         st.session_state.chat = None
+    return st.session_state.chat
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# ---- セッション初期化 ----
+# 会話履歴などは state_store に保存する（YUKKI_STATE_BACKEND で保存先を切り替え）
+conv = state_store.conversation()
+
+# 高速起動モードでは、クライアントの作成を最初の送信（またはウォームアップ）まで遅らせて初回描画を優先する
+if "chat" not in st.session_state:
+    st.session_state.chat = None
+    if not runtime.FAST_START:
+        # チャットは送信のたびに作り直すので、ここではクライアントだけを作っておく
+        st.session_state.client = runtime.get_client(API_KEY)
 
 # =========================================
 # メイン画面 UI
@@ -136,7 +157,7 @@ st.caption("知識は答え、思考は解法ガイドのみを返します。")
 # ---------- チャット履歴 ----------
 st.subheader("ユッキーとの会話履歴")
 
-for msg in st.session_state.messages:
+for msg in conv.messages:
     avatar_icon = "🧑" if msg["role"] == "user" else "yukki-.jpg"
     with st.chat_message(msg["role"], avatar=avatar_icon):
         st.markdown(msg["content"])
@@ -145,7 +166,7 @@ for msg in st.session_state.messages:
 if prompt := st.chat_input("質問を入力してください…"):
     
     # 履歴へ追加 (ユーザー)
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    conv.append_message("user", prompt)
 
     # Geminiへのメッセージ内容を構築するためのリスト
     contents_to_send = []
@@ -158,7 +179,7 @@ if prompt := st.chat_input("質問を入力してください…"):
         
         # Part.from_bytes() を使って画像データを Part オブジェクトに変換
         try:
-            image_part = Part.from_bytes(
+            image_part = genai_types.Part.from_bytes(
                 data=uploaded_bytes,
                 mime_type=uploaded_image.type
             )
@@ -167,13 +188,14 @@ if prompt := st.chat_input("質問を入力してください…"):
             print(f"画像データのPart変換中にエラーが発生しました: {e}")
             
     # ---- Gemini へ送信 ----
-    if st.session_state.chat:
+    chat = get_chat()
+    if chat:
         
         message_content = contents_to_send 
         
         try:
             # chat.send_message にリストを渡す
-            response = st.session_state.chat.send_message(message_content)
+            response = chat.send_message(message_content)
         except Exception as e:
             # 送信時のエラーをキャッチし、ログに出力
             response_text = f"Gemini API送信エラー: {type(e).__name__} - {e}"
@@ -181,12 +203,13 @@ if prompt := st.chat_input("質問を入力してください…"):
             
         else:
             response_text = response.text if hasattr(response, "text") else str(response)
+            conv.save_history(chat)
 
     else:
         response_text = "APIキーが設定されていないため応答できません。"
 
     # 履歴に追加 (アシスタント)
-    st.session_state.messages.append({"role": "assistant", "content": response_text})
+    conv.append_message("assistant", response_text)
 
     # 画像がアップロードされていた場合、次回再実行時に画像が再送信されるのを防ぐための処置
     if uploaded_image:
@@ -194,4 +217,9 @@ if prompt := st.chat_input("質問を入力してください…"):
         # 変数の参照をリセットする意図で残しています
         uploaded_image = None 
 
-    st.rerun()
\ No newline at end of file
+    st.rerun()
+
+# ---- 初回描画後のウォームアップ ----
+# クライアント生成・重いモジュールの読み込み・TLS接続をバックグラウンドで済ませておく
+runtime.start_prewarm(API_KEY)
+render.finish_profile()
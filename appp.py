@@ -1,9 +1,19 @@
 import streamlit as st
-from google import genai
-import base64, json, requests
-import streamlit.components.v1 as components
+import base64, json
 import os
 import time
+import prompt_cache
+import render
+import runtime
+import speech
+import state_store
+
+# 重いモジュールは初回利用時まで読み込まない（runtime.FAST_START）
+requests = runtime.lazy_import("requests")
+components = runtime.lazy_import("streamlit.components.v1")
+
+# 描画ペイロードの計測（YUKKI_RENDER_PROFILE=1 のときだけ有効）
+render.start_profile()
 
 # ===============================
 # 設定
@@ -18,10 +28,11 @@ SYSTEM_PROMPT = """
 あなたは小学生低学年の先生です。
 """
 # --- 共通設定 ---
-TTS_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-tts:generateContent"
 TTS_MODEL = "gemini-2.5-flash-preview-tts"
+TTS_API_URL = runtime.api_url(f"v1beta/models/{TTS_MODEL}:generateContent")
 TTS_VOICE = "Kore"
 MAX_RETRIES = 5
+TTS_CACHE_TTL = 24 * 60 * 60  # 同じ文章の音声は共有キャッシュから再利用する
 # ★お客様が指定したCSSに合わせて設定を調整
 SIDEBAR_FIXED_WIDTH = "450px"
 
@@ -34,11 +45,15 @@ except (KeyError, AttributeError):
 # ===============================
 # アバター画像取得 (キャッシュ) - 口パクを廃止し、1枚の静止画のみをロード
 # ===============================
+AVATAR_BASE_NAME = "yukki-static"
+AVATAR_EXTENSIONS = [".jpg", ".jpeg", ".png"] # PNGも探すように拡張
+AVATAR_FILES = [AVATAR_BASE_NAME + ext for ext in AVATAR_EXTENSIONS]
+
 @st.cache_data
 def get_avatar_image():
     # 探す画像ファイルのベース名を1つに絞る
-    base_name = "yukki-static"
-    extensions = [".jpg", ".jpeg", ".png"] # PNGも探すように拡張
+    base_name = AVATAR_BASE_NAME
+    extensions = AVATAR_EXTENSIONS
     loaded_image = None
     data_uri_prefix = ""
 
@@ -47,10 +62,10 @@ def get_avatar_image():
         try:
             # ユーザーがアップロードしたファイルをチェック
             if os.path.exists(file_name):
-                with open(file_name, "rb") as f:
-                    loaded_image = base64.b64encode(f.read()).decode("utf-8")
-                    data_uri_prefix = f"data:image/{'jpeg' if ext in ['.jpg', '.jpeg'] else 'png'};base64,"
-                    break
+                # base64化の結果はウォームアップと共有する
+                loaded_image = runtime.read_asset_b64(file_name)
+                data_uri_prefix = f"data:image/{'jpeg' if ext in ['.jpg', '.jpeg'] else 'png'};base64,"
+                break
         except FileNotFoundError:
             continue
 
@@ -68,9 +83,19 @@ def get_avatar_image():
 # 音声データ生成とSession State保存（リトライロジック含む）
 # ===============================
 def generate_and_store_tts(text):
-    """Gemini TTSで音声生成し、base64データをst.session_state.audio_to_playに保存する"""
+    """Gemini TTSで音声生成し、base64データを再生待ちの音声として会話ステートに保存する
+
+    text には speech.build_script() で作った読み上げ用の文章を渡す。
+    """
     if not API_KEY:
-        st.session_state.audio_to_play = None
+        conv.set_pending_audio(None)
+        return
+
+    cache_key = state_store.cache_key(TTS_MODEL, TTS_VOICE, text)
+    cached_audio = state_store.cache_get("tts", cache_key)
+    if cached_audio:
+        speech.report_tts(text, cached_audio, cached=True)
+        conv.set_pending_audio(cached_audio)
         return
         
     payload = {
@@ -86,13 +111,16 @@ def generate_and_store_tts(text):
     for attempt in range(MAX_RETRIES):
         try:
             # TTS APIには遅延があるため、リトライと指数バックオフを適用
-            response = requests.post(f"{TTS_API_URL}?key={API_KEY}", headers=headers, data=json.dumps(payload))
+            # 事前ウォームアップ済みのセッションで接続を使い回す
+            response = runtime.get_http_session().post(f"{TTS_API_URL}?key={API_KEY}", headers=headers, data=json.dumps(payload))
             response.raise_for_status()
             result = response.json()
 
             audio_data = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-            # 音声データをst.session_stateに保存
-            st.session_state.audio_to_play = audio_data
+            speech.report_tts(text, audio_data)
+            # 音声データを会話ステートと共有キャッシュに保存
+            conv.set_pending_audio(audio_data)
+            state_store.cache_put("tts", cache_key, audio_data, ttl=TTS_CACHE_TTL)
             return
 
         except requests.exceptions.HTTPError as e:
@@ -106,7 +134,7 @@ def generate_and_store_tts(text):
             print(f"Error generating TTS: {e}")
             break
             
-    st.session_state.audio_to_play = None
+    conv.set_pending_audio(None)
 
 # ===============================
 # Streamlit UI
@@ -114,8 +142,8 @@ def generate_and_store_tts(text):
 st.set_page_config(page_title="ユッキー", layout="wide")
 
 # --- グローバルCSSの適用 ---
-st.markdown(f"""
-<style>
+# サイドバーのレイアウトも含めて1つにまとめる（ブラウザ側キャッシュに載るので、再実行では参照だけが送られる）
+render.stylesheet("appp", f"""
 header {{ visibility: hidden; }}
 [data-testid="stSidebarContent"] > div:first-child {{
     width: {SIDEBAR_FIXED_WIDTH} !important;
@@ -139,24 +167,51 @@ header {{ visibility: hidden; }}
 [data-testid="stSidebarCollapseButton"] {{
     display: none !important;
 }}
-</style>
-""", unsafe_allow_html=True)
+/* ★★★ stSidebarとstSidebarContentに固定幅を適用し、確実にレイアウトを制御 ★★★ */
+/* サイドバーコンテナ自体を固定 */
+section[data-testid="stSidebar"] {{
+    width: {SIDEBAR_FIXED_WIDTH} !important;
+    min-width: {SIDEBAR_FIXED_WIDTH} !important;
+    max-width: {SIDEBAR_FIXED_WIDTH} !important;
+    background-color: #FFFFFF !important;
+}}
+/* メインコンテンツの背景色はメインのコンテナに適用するが、幅の固定とは無関係 */
+.main {{ background-color: #FFFFFF !important; }}
 
+/* アバターコンポーネントのスタイル */
+.avatar {{ width: 400px; height: 400px; border-radius: 16px; object-fit: cover; }}
+""")
 
-# --- セッションステートの初期化 ---
-if "client" not in st.session_state:
-    st.session_state.client = genai.Client(api_key=API_KEY) if API_KEY else None
-if "chat" not in st.session_state:
+
+# --- チャットセッション取得 ---
+def get_chat():
+    """保存済みの履歴からチャットセッションを作って返す（クライアントはプロセス全体で共有）
+
+    プロンプトキャッシュの参照先を会話の長さに合わせて切り替えるため、送信のたびに作り直す。
+    """
+    st.session_state.client = runtime.get_client(API_KEY)
     if st.session_state.client:
-        config = {"system_instruction": SYSTEM_PROMPT, "temperature": 0.2}
-        # Chat Sessionを初期化する際に、configを渡す
-        st.session_state.chat = st.session_state.client.chats.create(model="gemini-2.5-flash", config=config)
+        # 表示用の本文と読み上げ用の要約を1回の呼び出しで受け取る
+        config = speech.reply_config(SYSTEM_PROMPT, temperature=0.2)
+        # SYSTEM_PROMPT と会話の前半はコンテキストキャッシュから参照する
+        st.session_state.chat = prompt_cache.create_chat(
+            st.session_state.client, "gemini-2.5-flash", config,
+            history=conv.load_history(), conversation_id=conv.id
+        )
     else:
         st.session_state.chat = None
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "audio_to_play" not in st.session_state:
-    st.session_state.audio_to_play = None
+    return st.session_state.chat
+
+# --- セッションステートの初期化 ---
+# 会話履歴と再生待ちの音声は state_store に保存する（YUKKI_STATE_BACKEND で保存先を切り替え）
+conv = state_store.conversation()
+
+# 高速起動モードでは、クライアントの作成を最初の送信（またはウォームアップ）まで遅らせて初回描画を優先する
+if "chat" not in st.session_state:
+    st.session_state.chat = None
+    if not runtime.FAST_START:
+        # チャットは送信のたびに作り直すので、ここではクライアントだけを作っておく
+        st.session_state.client = runtime.get_client(API_KEY)
 
 # --- サイドバーにアバターと関連要素を配置 ---
 with st.sidebar:
@@ -167,23 +222,8 @@ with st.sidebar:
     if not has_image:
         st.warning("⚠️ アバター画像ファイル（yukki-static.jpg/jpeg/png）が見つかりません。")
 
-    # サイドバーのレイアウトとアバターを描画 (口パクJSを完全に削除)
+    # アバターを描画 (口パクJSを完全に削除、スタイルはグローバルCSSに統合)
     st.markdown(f"""
-    <style>
-    /* ★★★ stSidebarとstSidebarContentに固定幅を適用し、確実にレイアウトを制御 ★★★ */
-    /* サイドバーコンテナ自体を固定 */
-    section[data-testid="stSidebar"] {{
-        width: {SIDEBAR_FIXED_WIDTH} !important;
-        min-width: {SIDEBAR_FIXED_WIDTH} !important;
-        max-width: {SIDEBAR_FIXED_WIDTH} !important;
-        background-color: #FFFFFF !important;
-    }}
-    /* メインコンテンツの背景色はメインのコンテナに適用するが、幅の固定とは無関係 */
-    .main {{ background-color: #FFFFFF !important; }}
-    
-    /* アバターコンポーネントのスタイル */
-    .avatar {{ width: 400px; height: 400px; border-radius: 16px; object-fit: cover; }}
-    </style>
     <img id="avatar" src="{data_uri_prefix}{img_base64}" class="avatar">
     
     <script>
@@ -194,7 +234,8 @@ with st.sidebar:
     """, unsafe_allow_html=True)
 
 # --- 音声再生トリガーをサイドバーに追加（WAV変換ロジックのみ残す） ---
-if st.session_state.audio_to_play:
+audio_to_play = conv.pop_pending_audio()
+if audio_to_play:
     # WAV変換ヘルパー関数を定義したJavaScriptコードを挿入
     js_code = f"""
     <script>
@@ -235,7 +276,7 @@ if st.session_state.audio_to_play:
         }}
 
         // --- 再生ロジック ---
-        const base64AudioData = '{st.session_state.audio_to_play}';
+        const base64AudioData = '{audio_to_play}';
         const sampleRate = 24000; // Gemini TTSのデフォルトPCMレート
         
         // 口パク開始ロジックを削除
@@ -260,9 +301,8 @@ if st.session_state.audio_to_play:
     </script>
     """
     # height=0, width=0のカスタムコンポーネントでスクリプトを実行
+    # 再生待ちの音声は pop_pending_audio() で取り出した時点でクリア済み
     components.html(js_code, height=0, width=0)
-    # 再生トリガー実行後、データをクリア
-    st.session_state.audio_to_play = None
 
 # --- メインコンテンツ ---
 st.title("🎀 ユッキー（AIアシスタント）")
@@ -325,7 +365,7 @@ if (SpeechRecognition) {
 """, height=130)
 
 st.subheader("ユッキーとの会話履歴")
-for msg in st.session_state.messages:
+for msg in conv.messages:
     avatar_icon = "🧑" if msg["role"] == "user" else "🤖"
     with st.chat_message(msg["role"], avatar=avatar_icon):
         st.markdown(msg["content"])
@@ -333,32 +373,34 @@ for msg in st.session_state.messages:
 # --- チャット入力と処理 ---
 if prompt := st.chat_input("質問を入力してください..."):
     # 1. ユーザーメッセージを追加・表示
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    conv.append_message("user", prompt)
     
     # 2. アシスタントの応答を取得・表示
     with st.chat_message("assistant", avatar="🤖"):
         with st.spinner("ユッキーが思考中..."):
-            if st.session_state.chat:
+            chat = get_chat()
+            if chat:
                 try:
                     # Gemini API呼び出し
-                    response = st.session_state.chat.send_message(prompt)
-                    text = response.text
+                    response = chat.send_message(prompt)
+                    text, spoken_summary = speech.parse_reply(response.text)
+                    conv.save_history(chat)
                     
                     # 応答テキストを表示
                     st.markdown(text)
                     
-                    # 3. 音声データを生成してセッションステートに保存
-                    generate_and_store_tts(text)
+                    # 3. 読み上げ用に整えた文章で音声データを生成してセッションステートに保存
+                    generate_and_store_tts(speech.build_script(text, spoken_summary))
                     
                     # 4. メッセージを履歴に追加
-                    st.session_state.messages.append({"role": "assistant", "content": text})
+                    conv.append_message("assistant", text)
 
                 except Exception as e:
                     error_msg = f"APIエラーが発生しました: {e}"
                     st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    conv.append_message("assistant", error_msg)
             else:
-                st.session_state.messages.append({"role": "assistant", "content": "APIキーが設定されていないため、お答えできません。"})
+                conv.append_message("assistant", "APIキーが設定されていないため、お答えできません。")
     
     # Rerunを実行し、UIを更新
     st.rerun()
@@ -378,4 +420,9 @@ window.addEventListener('message', event => {
     }
 });
 </script>
-""", height=0)
\ No newline at end of file
+""", height=0)
+
+# --- 初回描画後のウォームアップ ---
+# クライアント生成・重いモジュールの読み込み・アバターのbase64化・TLS接続をバックグラウンドで済ませておく
+runtime.start_prewarm(API_KEY, assets=AVATAR_FILES, tts=True)
+render.finish_profile()
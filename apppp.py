@@ -1,8 +1,17 @@
 import streamlit as st
-from google import genai
-import base64, json, requests
-import streamlit.components.v1 as components
+import base64, json
 import os
+import prompt_cache
+import render
+import runtime
+import speech
+import state_store
+
+# 重いモジュールは初回利用時まで読み込まない（runtime.FAST_START）
+components = runtime.lazy_import("streamlit.components.v1")
+
+# 描画ペイロードの計測（YUKKI_RENDER_PROFILE=1 のときだけ有効）
+render.start_profile()
  
 # ===============================
 # 設定
@@ -15,8 +24,8 @@ SYSTEM_PROMPT = """
 2️⃣ 思考・計算問題は答えを教えず、解法のヒントのみ。
 3️⃣ 途中式を見せられた場合は正誤を判定し、優しく導く。
 """
-TTS_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-tts:generateContent"
 TTS_MODEL = "gemini-2.5-flash-preview-tts"
+TTS_API_URL = runtime.api_url(f"v1beta/models/{TTS_MODEL}:generateContent")
 TTS_VOICE = "Kore"
 try:
     API_KEY = st.secrets["GEMINI_API_KEY"]
@@ -26,10 +35,14 @@ except:
 # ===============================
 # アバター画像取得 (キャッシュ)
 # ===============================
+AVATAR_BASE_NAMES = ["yukki-close", "yukki-open"]
+AVATAR_EXTENSIONS = [".jpg", ".jpeg"]
+AVATAR_FILES = [base + ext for base in AVATAR_BASE_NAMES for ext in AVATAR_EXTENSIONS]
+ 
 @st.cache_data
 def get_avatar_images():
-    base_names = ["yukki-close", "yukki-open"]
-    extensions = [".jpg", ".jpeg"]
+    base_names = AVATAR_BASE_NAMES
+    extensions = AVATAR_EXTENSIONS
     loaded_images = {}
     data_uri_prefix = ""
  
@@ -37,10 +50,10 @@ def get_avatar_images():
         for ext in extensions:
             file_name = base + ext
             try:
-                with open(file_name, "rb") as f:
-                    loaded_images[base] = base64.b64encode(f.read()).decode("utf-8")
-                    data_uri_prefix = f"data:image/{'jpeg' if ext in ['.jpg', '.jpeg'] else 'png'};base64,"
-                    break
+                # base64化の結果はウォームアップと共有する
+                loaded_images[base] = runtime.read_asset_b64(file_name)
+                data_uri_prefix = f"data:image/{'jpeg' if ext in ['.jpg', '.jpeg'] else 'png'};base64,"
+                break
             except FileNotFoundError:
                 continue
  
@@ -59,6 +72,12 @@ def get_avatar_images():
 def generate_and_store_tts(text):
     if not API_KEY:
         return
+    cache_key = state_store.cache_key(TTS_MODEL, text)
+    cached_audio = state_store.cache_get("tts", cache_key)
+    if cached_audio:
+        speech.report_tts(text, cached_audio, cached=True)
+        conv.set_pending_audio(cached_audio)
+        return
     payload = {
         "contents": [{"parts": [{"text": text}]}],
         "generationConfig": {"responseModalities": ["AUDIO"]},
@@ -66,11 +85,14 @@ def generate_and_store_tts(text):
     }
     headers = {'Content-Type': 'application/json'}
     try:
-        response = requests.post(f"{TTS_API_URL}?key={API_KEY}", headers=headers, data=json.dumps(payload))
+        response = runtime.get_http_session().post(f"{TTS_API_URL}?key={API_KEY}", headers=headers, data=json.dumps(payload))
         response.raise_for_status()
         result = response.json()
-        # 音声データをst.session_stateに保存
-        st.session_state.audio_to_play = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
+        # 音声データを会話ステートと共有キャッシュに保存
+        audio_data = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
+        speech.report_tts(text, audio_data)
+        conv.set_pending_audio(audio_data)
+        state_store.cache_put("tts", cache_key, audio_data)
     except Exception as e:
         st.error(f"❌ 音声データ取得に失敗しました。詳細: {e}")
  
@@ -79,31 +101,37 @@ def generate_and_store_tts(text):
 # ===============================
 st.set_page_config(page_title="ユッキー", layout="wide")
  
-# --- セッションステートの初期化 ---
-if "client" not in st.session_state:
-    st.session_state.client = genai.Client(api_key=API_KEY) if API_KEY else None
-if "chat" not in st.session_state:
+# --- チャットセッション取得 ---
+def get_chat():
+    """チャットセッションを保存済みの履歴から作り直して返す（前置きはプロンプトキャッシュを参照）"""
+    st.session_state.client = runtime.get_client(API_KEY)
     if st.session_state.client:
-        config = {"system_instruction": SYSTEM_PROMPT, "temperature": 0.2}
-        st.session_state.chat = st.session_state.client.chats.create(model="gemini-2.5-flash", config=config)
+        config = speech.reply_config(SYSTEM_PROMPT, temperature=0.2)
+        st.session_state.chat = prompt_cache.create_chat(st.session_state.client, "gemini-2.5-flash", config, history=conv.load_history(), conversation_id=conv.id)
     else:
         st.session_state.chat = None
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-# ★★★ 変更点：音声再生用のセッションステートを追加 ★★★
-if "audio_to_play" not in st.session_state:
-    st.session_state.audio_to_play = None
+    return st.session_state.chat
+ 
+# --- セッションステートの初期化 ---
+conv = state_store.conversation()
+if "chat" not in st.session_state:
+    st.session_state.chat = None
+    if not runtime.FAST_START:
+        # チャットは送信のたびに作り直すので、ここではクライアントだけを作っておく
+        st.session_state.client = runtime.get_client(API_KEY)
+ 
+# --- CSS（小さいのでセッションごとに1度だけページに登録） ---
+render.stylesheet("apppp", """
+section[data-testid="stSidebar"] { width: 450px !important; background-color: #FFFFFF !important; }
+.main { background-color: #FFFFFF !important; }
+.st-emotion-cache-1y4p8pa { display: flex; flex-direction: column; align-items: center; justify-content: center; height: 100vh; }
+.avatar { width: 400px; height: 400px; border-radius: 16px; object-fit: cover; }
+""")
  
 # --- サイドバーにアバターと関連要素を配置 ---
 with st.sidebar:
     img_close_base64, img_open_base64, data_uri_prefix, has_images = get_avatar_images()
     st.markdown(f"""
-    <style>
-    section[data-testid="stSidebar"] {{ width: 450px !important; background-color: #FFFFFF !important; }}
-    .main {{ background-color: #FFFFFF !important; }}
-    .st-emotion-cache-1y4p8pa {{ display: flex; flex-direction: column; align-items: center; justify-content: center; height: 100vh; }}
-    .avatar {{ width: 400px; height: 400px; border-radius: 16px; object-fit: cover; }}
-    </style>
     <img id="avatar" src="{data_uri_prefix}{img_close_base64}" class="avatar">
     <script>
     const imgCloseBase64 = "{data_uri_prefix}{img_close_base64}";
@@ -126,11 +154,12 @@ with st.sidebar:
     """, unsafe_allow_html=True)
  
 # ★★★ 変更点：音声再生トリガーをここに追加 ★★★
-if st.session_state.audio_to_play:
+audio_to_play = conv.pop_pending_audio()
+if audio_to_play:
     st.sidebar.markdown(f"""
     <script>
     if (window.startTalking) window.startTalking();
-    const audio = new Audio('data:audio/wav;base64,{st.session_state.audio_to_play}');
+    const audio = new Audio('data:audio/wav;base64,{audio_to_play}');
     audio.autoplay = true;
     audio.onended = () => {{ if (window.stopTalking) window.stopTalking(); }};
     audio.play().catch(e => {{
@@ -139,8 +168,6 @@ if st.session_state.audio_to_play:
     }});
     </script>
     """, unsafe_allow_html=True)
-    # 再生したらクリアする
-    st.session_state.audio_to_play = None
  
 # --- メインコンテンツ ---
 st.title("🎀 ユッキー")
@@ -176,21 +203,24 @@ if (SpeechRecognition) {
 """, height=130)
  
 st.subheader("ユッキーとの会話履歴")
-for msg in st.session_state.messages:
+for msg in conv.messages:
     with st.chat_message(msg["role"], avatar="🧑" if msg["role"] == "user" else "🤖"):
         st.markdown(msg["content"])
  
 # --- チャット入力と処理 ---
 if prompt := st.chat_input("質問を入力してください..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    if st.session_state.chat:
-        response = st.session_state.chat.send_message(prompt)
-        text = response.text
-        st.session_state.messages.append({"role": "assistant", "content": text})
+    conv.append_message("user", prompt)
+    chat = get_chat()
+    if chat:
+        response = chat.send_message(prompt)
+        text, spoken_summary = speech.parse_reply(response.text)
+        conv.save_history(chat)
+        conv.append_message("assistant", text)
         # ★★★ 変更点：音声データを生成してセッションステートに保存 ★★★
-        generate_and_store_tts(text)
+        # Markdownや絵文字を除いた読み上げ用の文章だけをTTSに送る
+        generate_and_store_tts(speech.build_script(text, spoken_summary))
     else:
-        st.session_state.messages.append({"role": "assistant", "content": "APIキーが設定されていないため、お答えできません。"})
+        conv.append_message("assistant", "APIキーが設定されていないため、お答えできません。")
     st.rerun()
  
 # --- 音声認識からチャット入力へテキストを転送するJavaScript ---
@@ -209,4 +239,8 @@ window.addEventListener('message', event => {
 });
 </script>
 """, height=0)
- 
\ No newline at end of file
+ 
+ 
+# --- 初回描画後のウォームアップ ---
+runtime.start_prewarm(API_KEY, assets=AVATAR_FILES, tts=True)
+render.finish_profile()
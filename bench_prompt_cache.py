@@ -0,0 +1,109 @@
+"""
+プロンプトキャッシュのベンチマーク
+
+ローカルスタンドインに対して同じ会話（1回およそ --reply-tokens トークンの長い応答が続くセッション）を
+プロンプトキャッシュなし / ありで流し、ターンごとの入力トークン・課金換算の入力トークン・
+ターン遅延を比較します。スタンドインはキャッシュされていない入力トークンに比例した
+prefill 遅延 (--prefill-per-1k) を加えます。
+
+SYSTEM_PROMPT だけでは最小キャッシュサイズ (1024 トークン) に届かないため、
+序盤のターンはキャッシュなしと同じになり、会話が伸びたところから会話の前半がキャッシュされます。
+
+課金換算にはキャッシュ作成時のトークン（通常の入力と同じ単価）を含めます。
+キャッシュの保存料金は時間単位なので、作成したトークン数 × TTL の上限値として別に表示します。
+
+    python bench_prompt_cache.py --app app.py --turns 8 --prefill-per-1k 0.2
+    python bench_prompt_cache.py --app app.py --turns 8 --reply-tokens 250   # 短めの応答
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from standin import REPLY_TEXT, start_standin
+
+APPS = ["app.py", "appp.py", "apppp.py"]
+QUESTIONS = ["3×4はいくつ？", "かけ算ってなに？", "九九の覚え方を教えて", "わり算とのちがいは？"]
+
+
+def long_reply(tokens):
+    """説明の長い先生役の応答（スタンドインの見積もりでおよそ tokens トークン）"""
+    paragraph = REPLY_TEXT + "\n\n"
+    return paragraph * max(1, -(-tokens * 2 // len(paragraph)))
+
+
+def run_session(app_path, turns, server, enabled):
+    """1セッション分のターンを流し、ターンごとの (遅延, 入力トークン, キャッシュ済みトークン, キャッシュ作成トークン) を返す"""
+    import prompt_cache
+    from streamlit.testing.v1 import AppTest
+
+    prompt_cache.ENABLED = enabled
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.secrets["GEMINI_API_KEY"] = "standin"
+    at.run()
+    results = []
+    for turn in range(turns):
+        seen, created = len(server.usage), len(server.cache_creations)
+        start = time.perf_counter()
+        at.chat_input[0].set_value(QUESTIONS[turn % len(QUESTIONS)]).run()
+        latency = time.perf_counter() - start
+        for error in at.exception:
+            print(f"  ! {error.value}", file=sys.stderr)
+        usage = server.usage[seen:]
+        results.append((
+            latency,
+            sum(u["prompt_tokens"] for u in usage),
+            sum(u["cached_tokens"] for u in usage),
+            sum(server.cache_creations[created:]),
+        ))
+    return results
+
+
+def billed(prompt_tokens, cached_tokens, creation_tokens=0):
+    import prompt_cache
+
+    return prompt_tokens - cached_tokens + cached_tokens * prompt_cache.CACHED_TOKEN_RATE + creation_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユッキー プロンプトキャッシュ ベンチマーク")
+    parser.add_argument("--app", default="app.py", choices=APPS)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="スタンドインの応答の固定遅延（秒）")
+    parser.add_argument("--prefill-per-1k", type=float, default=0.2,
+                        help="キャッシュされていない入力1000トークンあたりの遅延（秒）")
+    parser.add_argument("--reply-tokens", type=int, default=1000, help="1回の応答のおおよそのトークン数")
+    args = parser.parse_args()
+
+    server = start_standin(latency=args.latency, prefill_per_1k=args.prefill_per_1k, reply_text=long_reply(args.reply_tokens))
+    os.environ["GEMINI_BASE_URL"] = server.base_url
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.app)
+
+    # ウォームアップ（google.genai のインポートやクライアント作成は計測から外す）
+    run_session(app_path, 1, server, False)
+    modes = {}
+    for name, enabled in (("no cache", False), ("cache", True)):
+        caches_before = len(server.cache_creations)
+        modes[name] = run_session(app_path, args.turns, server, enabled)
+        print(f"{name}: {len(server.cache_creations) - caches_before} cache(s) created")
+
+    import prompt_cache
+
+    print(f"app={args.app} turns={args.turns} reply~{args.reply_tokens} tokens latency={args.latency}s prefill={args.prefill_per_1k}s/1k tokens")
+    print(f"{'turn':>4} | {'input':>6} {'billed':>7} {'latency':>8} | "
+          f"{'input':>6} {'cached':>6} {'created':>7} {'billed':>7} {'latency':>8}")
+    for turn, (plain, cached) in enumerate(zip(modes["no cache"], modes["cache"]), 1):
+        print(f"{turn:>4} | {plain[1]:>6} {billed(*plain[1:]):>7.0f} {plain[0]:>7.3f}s | "
+              f"{cached[1]:>6} {cached[2]:>6} {cached[3]:>7} {billed(*cached[1:]):>7.0f} {cached[0]:>7.3f}s")
+    for name, results in modes.items():
+        total_billed = sum(billed(*r[1:]) for r in results)
+        created = sum(r[3] for r in results)
+        storage = f", storage <= {created * prompt_cache.CACHE_TTL_SECONDS / 3600:.0f} token-hours" if created else ""
+        print(f"{name:>8}: billed input {total_billed:.0f} tokens (incl. {created} at cache creation){storage}, "
+              f"median turn {statistics.median(r[0] for r in results):.3f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+描画ペイロードのベンチマーク
+
+ローカルスタンドインを相手にアプリを `streamlit run` で実際に起動し、ブラウザ役のクライアント
+(browser.py) で会話を流して、WebSocket で受け取ったバイト数と要素数を1ターンごと
+（送信時の実行 + st.rerun() 後の再実行）に集計します。サーバーはリポジトリ直下で起動するので、
+本番と同じく .streamlit/config.toml（global.minCachedMessageSize など）が読み込まれ、
+クライアントはブラウザと同じようにキャッシュ済みメッセージのハッシュを送り返します。
+
+CSS を毎回 st.markdown で送る従来の方法 (YUKKI_RENDER_DEDUP=0) と、
+render.stylesheet() の既定の方法（閾値未満の CSS だけセッションに1度だけ送る）を比較します。
+CSS が閾値以上のアプリ (appp.py) では、どちらも st.markdown で送るので同じ結果になります。
+--min-cached-message-size 10000 を付けると Streamlit 既定の閾値で起動して比べられます。
+
+    python bench_render.py --app appp.py --turns 4 --sites
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+from browser import BrowserSession, wait_healthy
+from standin import start_standin
+
+APPS = ["app.py", "appp.py", "apppp.py"]
+QUESTIONS = ["3×4はいくつ？", "かけ算ってなに？", "九九の覚え方を教えて", "わり算とのちがいは？"]
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _start_app(app_path, port, dedup, base_url, secrets_path, min_cached):
+    """YUKKI_RENDER_PROFILE=1 でアプリを起動し、(プロセス, Render ログの行のリスト) を返す"""
+    env = dict(
+        os.environ,
+        GEMINI_BASE_URL=base_url,
+        YUKKI_RENDER_DEDUP="1" if dedup else "0",
+        YUKKI_RENDER_PROFILE="1",
+        PYTHONUNBUFFERED="1",  # Render ログをターンごとに読めるようにする
+    )
+    if min_cached is not None:
+        env["STREAMLIT_GLOBAL_MIN_CACHED_MESSAGE_SIZE"] = str(min_cached)
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "streamlit", "run", app_path,
+            "--server.port", str(port),
+            "--server.address", "127.0.0.1",
+            "--server.headless", "true",
+            "--secrets.files", secrets_path,
+        ],
+        env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    log = []
+
+    def drain():
+        for line in proc.stdout:
+            if line.startswith("Render:"):
+                log.append(line.rstrip())
+
+    threading.Thread(target=drain, daemon=True).start()
+    if not wait_healthy(port, proc=proc):
+        proc.kill()
+        raise RuntimeError(f"streamlit did not start on port {port}")
+    return proc, log
+
+
+def run_session(app_path, turns, dedup, port, base_url, secrets_path, min_cached=None):
+    """初回表示と各ターンの描画ペイロード、最後のターンの Render ログを返す"""
+    proc, log = _start_app(app_path, port, dedup, base_url, secrets_path, min_cached)
+    try:
+        browser = BrowserSession(port, "bench-render")
+        browser.open()
+        results = [browser.last_run]
+        for turn in range(turns):
+            seen = len(log)
+            browser.send(QUESTIONS[turn % len(QUESTIONS)])
+            results.append(browser.last_run)
+        for error in browser.errors:
+            print(f"  ! {error}", file=sys.stderr)
+        browser.close()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return results, log[seen:] if turns else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユッキー 描画ペイロード ベンチマーク")
+    parser.add_argument("--app", default="appp.py", choices=APPS)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8731)
+    parser.add_argument("--min-cached-message-size", type=int, default=None,
+                        help="サーバーの global.minCachedMessageSize を上書きする（既定は .streamlit/config.toml の値）")
+    parser.add_argument("--sites", action="store_true", help="最後のターンの呼び出し位置ごとの内訳を表示する")
+    args = parser.parse_args()
+
+    # サーバーと同じ設定ファイルを読むよう、リポジトリ直下で設定を読み込む
+    os.chdir(ROOT)
+    from streamlit import config
+
+    min_cached = args.min_cached_message_size
+    if min_cached is None:
+        min_cached = config.get_option("global.minCachedMessageSize")
+    server = start_standin()
+    app_path = os.path.join(ROOT, args.app)
+    secrets_path = os.path.join(tempfile.mkdtemp(prefix="yukki-render-"), "secrets.toml")
+    with open(secrets_path, "w", encoding="utf-8") as f:
+        f.write('GEMINI_API_KEY = "standin"\n')
+
+    modes = {}
+    logs = {}
+    for name, dedup in (("inline", False), ("dedup", True)):
+        modes[name], logs[name] = run_session(app_path, args.turns, dedup, args.port, server.base_url, secrets_path,
+                                              args.min_cached_message_size)
+
+    print(f"app={args.app} turns={args.turns} "
+          f"minCachedMessageSize={min_cached:.0f} "
+          f"maxCachedMessageAge={config.get_option('global.maxCachedMessageAge')}")
+    print(f"{'':>6} | {'inline bytes':>12} {'elements':>8} | {'dedup bytes':>12} {'elements':>8}")
+    for i, (inline, dedup) in enumerate(zip(modes["inline"], modes["dedup"])):
+        label = "open" if i == 0 else f"turn {i}"
+        print(f"{label:>6} | {inline['bytes']:>12,} {inline['elements']:>8} | {dedup['bytes']:>12,} {dedup['elements']:>8}")
+    for name, results in modes.items():
+        turns = results[1:]
+        per_turn = sum(r["bytes"] for r in turns) / max(1, len(turns))
+        # 音声を含むターンは大きく振れるので中央値も出す
+        median = statistics.median(r["bytes"] for r in turns) if turns else 0
+        print(f"{name:>6}: {per_turn:,.0f} bytes/turn (median {median:,.0f}), "
+              f"{sum(r['elements'] for r in turns) / max(1, len(turns)):.1f} elements/turn")
+    if args.sites:
+        for name, lines in logs.items():
+            print(f"\n{name}: last turn (server log)")
+            for line in lines:
+                print(f"  {line}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+記録・再生による性能回帰チェック
+
+決まった生徒の会話（SESSION）をアプリに流し、Gemini と TTS とのやり取りを
+カセット (cassette.py) に記録します。再生モードではネットワークに出ずに同じ会話を
+何度でも再現し、ターンごとの「アプリ側の時間」（ターン全体からAPI待ち時間を引いたもの）を
+ベースラインと比べて遅くなったターンを報告します（見つかれば終了コード 1）。
+
+    python bench_replay.py record --app appp.py            # 実 API（GEMINI_API_KEY）で記録
+    python bench_replay.py record --app appp.py --standin  # ローカルスタンドインで記録
+    python bench_replay.py replay --app appp.py --update-baseline
+    python bench_replay.py replay --app appp.py --latency recorded
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+APPS = ["app.py", "appp.py", "apppp.py"]
+# 生徒役の決まった会話
+SESSION = [
+    "3×4はいくつ？",
+    "うーん、わからない",
+    "3が4こだから12かな？",
+    "じゃあ 6×7 は？",
+    "九九の覚え方を教えて",
+]
+MIN_SLOWDOWN_SECONDS = 0.05  # これより小さい差は揺らぎとして扱う
+
+
+def run_session(app_path, api_key):
+    """SESSION を1回流し、ターンごとの (全体の秒数, API待ちの秒数) を返す"""
+    import cassette
+    import runtime
+    import state_store
+    from streamlit.testing.v1 import AppTest
+
+    # TTS・プロンプトキャッシュの記録を消して、毎回同じ流れ（同じリクエスト）にする
+    state_store.cache_clear()
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.secrets["GEMINI_API_KEY"] = api_key
+    at.run()
+    runtime.wait_prewarm(30)
+    turns = []
+    for question in SESSION:
+        before = cassette.stats()["network_seconds"]
+        start = time.perf_counter()
+        at.chat_input[0].set_value(question).run()
+        total = time.perf_counter() - start
+        turns.append((total, cassette.stats()["network_seconds"] - before))
+        for error in at.exception:
+            print(f"  ! {error.value}", file=sys.stderr)
+    return turns
+
+
+def _baseline_path(cassette_dir, app):
+    return os.path.join(cassette_dir, f"baseline-{os.path.splitext(app)[0]}.json")
+
+
+def record(args, app_path):
+    import cassette
+
+    api_key = os.environ.get("GEMINI_API_KEY", "")
+    if args.standin:
+        from standin import start_standin
+
+        server = start_standin(latency=0.3, tts_latency=0.5)
+        os.environ["GEMINI_BASE_URL"] = server.base_url
+        api_key = "standin"
+    if not api_key:
+        sys.exit("GEMINI_API_KEY を設定するか --standin を指定してください")
+    turns = run_session(app_path, api_key)
+    for i, (total, network) in enumerate(turns, 1):
+        print(f"turn {i}: {total:.3f}s (API {network:.3f}s)")
+    print(f"recorded {cassette.stats()['exchanges']} exchanges into {cassette.CASSETTE_DIR}")
+
+
+def replay(args, app_path):
+    import cassette
+
+    runs = [run_session(app_path, "replay") for _ in range(args.runs)]
+    if cassette.stats()["misses"]:
+        sys.exit(f"{cassette.stats()['misses']} request(s) had no recording; re-record with `record`")
+    app_seconds = [statistics.median(run[i][0] - run[i][1] for run in runs) for i in range(len(SESSION))]
+    network_seconds = [statistics.median(run[i][1] for run in runs) for i in range(len(SESSION))]
+
+    baseline_path = _baseline_path(cassette.CASSETTE_DIR, args.app)
+    baseline = None
+    if os.path.exists(baseline_path) and not args.update_baseline:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)["app_seconds"]
+
+    print(f"app={args.app} runs={args.runs} latency={cassette.REPLAY_LATENCY}")
+    print(f"{'turn':>4} {'app':>8} {'API':>8} {'baseline':>9}  question")
+    slow = []
+    for i, question in enumerate(SESSION):
+        base = baseline[i] if baseline and i < len(baseline) else None
+        flag = ""
+        if base is not None and app_seconds[i] > base * (1 + args.tolerance) and app_seconds[i] - base > MIN_SLOWDOWN_SECONDS:
+            flag = "  SLOWER"
+            slow.append(i + 1)
+        base_text = f"{base:>8.3f}s" if base is not None else f"{'-':>9}"
+        print(f"{i + 1:>4} {app_seconds[i]:>7.3f}s {network_seconds[i]:>7.3f}s {base_text}  {question}{flag}")
+
+    if args.update_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump({"app": args.app, "session": SESSION, "app_seconds": app_seconds}, f, ensure_ascii=False, indent=2)
+        print(f"baseline written to {baseline_path}")
+    elif slow:
+        print(f"app-side slowdown on turn(s) {slow} (tolerance {args.tolerance:.0%})")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユッキー 記録・再生による性能回帰チェック")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--app", default="appp.py", choices=APPS)
+    parser.add_argument("--cassette-dir", default=None, help="カセットの保存先（既定は YUKKI_CASSETTE_DIR）")
+    parser.add_argument("--standin", action="store_true", help="記録時にローカルスタンドインを使う")
+    parser.add_argument("--runs", type=int, default=3, help="再生の繰り返し回数（中央値を使う）")
+    parser.add_argument("--latency", default="0", help="再生時の遅延: recorded または秒数")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="ベースラインからの許容増加率")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # cassette / runtime はインポート時に設定を読むので、先に環境変数を設定する
+    os.environ["YUKKI_CASSETTE"] = args.mode
+    os.environ["YUKKI_REPLAY_LATENCY"] = args.latency
+    if args.cassette_dir:
+        os.environ["YUKKI_CASSETTE_DIR"] = args.cassette_dir
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.app)
+    if args.mode == "record":
+        record(args, app_path)
+    else:
+        replay(args, app_path)
+
+
+if __name__ == "__main__":
+    main()
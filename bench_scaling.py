@@ -0,0 +1,173 @@
+"""
+マルチワーカーのスケーリングベンチマーク
+
+serve.py を 1/2/4/8 ワーカーで実際に起動し、そのロードバランサーに対して
+ブラウザと同じ HTTP + WebSocket (/_stcore/stream) で会話を流して、
+スループットとターン遅延を計測します。
+
+各セッションは最初に HTTP でページを取得してロードバランサーから固定先ワーカーの
+Cookie (yukki_worker) を受け取り、以降のターンはその Cookie を付けた1本の WebSocket で送ります。
+つまり本番と同じく、1つの会話は1つのワーカーに固定された構成を計測します。
+最後に共有 SQLite の履歴件数を確認し、全会話が欠けずに保存されていることを検証します。
+
+    python bench_scaling.py --app appp.py --sessions 16 --turns 3 --workers 1 2 4 8
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from browser import BrowserSession, wait_healthy
+from standin import start_standin
+
+APPS = ["app.py", "appp.py", "apppp.py"]
+QUESTIONS = ["3×4はいくつ？", "かけ算ってなに？", "九九の覚え方を教えて", "わり算とのちがいは？"]
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+# ===============================
+# serve.py の起動
+# ===============================
+def start_serve(app_path, workers, port, worker_base_port, db_path, base_url, secrets_path):
+    env = dict(os.environ, GEMINI_BASE_URL=base_url)
+    proc = subprocess.Popen(
+        [
+            sys.executable, os.path.join(ROOT, "serve.py"),
+            "--app", app_path,
+            "--workers", str(workers),
+            "--port", str(port),
+            "--worker-base-port", str(worker_base_port),
+            "--db", db_path,
+            "--secrets.files", secrets_path,
+        ],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    # 全ワーカーが応答するまで待つ
+    for i in range(workers):
+        if not wait_healthy(worker_base_port + i, proc=proc):
+            stop_serve(proc)
+            raise RuntimeError(f"serve.py did not start {workers} worker(s)")
+    return proc
+
+
+def stop_serve(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ===============================
+# 計測
+# ===============================
+def _message_counts(db_path):
+    import sqlite3
+
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT sid, COUNT(*) FROM messages GROUP BY sid").fetchall())
+
+
+def _run_session(port, sid, turns, barrier, latencies, errors, workers_used):
+    session = None
+    try:
+        session = BrowserSession(port, sid)
+        session.open()
+        workers_used.append(session.worker)
+        barrier.wait()
+        # 同じ会話のターンは順番に、異なる会話は並列に処理する
+        for turn in range(turns):
+            latencies.append(session.send(QUESTIONS[turn % len(QUESTIONS)]))
+    except Exception as e:
+        errors.append(f"{sid}: {e!r}")
+        barrier.abort()
+    finally:
+        if session is not None:
+            errors.extend(session.errors)
+            session.close()
+
+
+def measure(app_path, workers, sessions, turns, base_url, port, worker_base_port):
+    tmp_dir = tempfile.mkdtemp(prefix="yukki-scaling-")
+    db_path = os.path.join(tmp_dir, "state.db")
+    secrets_path = os.path.join(tmp_dir, "secrets.toml")
+    with open(secrets_path, "w", encoding="utf-8") as f:
+        f.write('GEMINI_API_KEY = "standin"\n')
+
+    proc = start_serve(app_path, workers, port, worker_base_port, db_path, base_url, secrets_path)
+    sids = [f"bench-{workers}-{i}" for i in range(sessions)]
+    latencies, errors, workers_used = [], [], []
+    try:
+        # ウォームアップ（ワーカーごとのインポートとクライアント作成は計測から外す）。
+        # ロードバランサーは新しいブラウザを順番に割り当てるので、ワーカー数だけ流せば全員に当たる
+        for i in range(workers):
+            warmup = BrowserSession(port, f"warmup-{workers}-{i}")
+            warmup.open()
+            warmup.send(QUESTIONS[0])
+            warmup.close()
+
+        # 全セッションが接続し初回表示を終えてから一斉にターンを始める
+        barrier = threading.Barrier(sessions + 1)
+        threads = [
+            threading.Thread(target=_run_session, args=(port, sid, turns, barrier, latencies, errors, workers_used))
+            for sid in sids
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        stop_serve(proc)
+
+    counts = _message_counts(db_path)
+    consistent = all(counts.get(sid) == 2 * turns for sid in sids)
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else 0.0,
+        "per_worker": [workers_used.count(str(i)) for i in range(workers)],
+        "consistent": consistent,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユッキー マルチワーカー スケーリングベンチマーク")
+    parser.add_argument("--app", default="appp.py", choices=APPS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="スタンドインの応答遅延（秒）")
+    parser.add_argument("--port", type=int, default=8701, help="ロードバランサーのポート")
+    parser.add_argument("--worker-base-port", type=int, default=8711)
+    args = parser.parse_args()
+
+    app_path = os.path.join(ROOT, args.app)
+    server = start_standin(latency=args.latency)
+    print(f"cores={os.cpu_count()} app={args.app} sessions={args.sessions} turns={args.turns}")
+    print(f"{'workers':>7} {'turns/s':>8} {'p50':>8} {'p95':>8}  {'sessions/worker':<16} state")
+    for workers in args.workers:
+        result = measure(app_path, workers, args.sessions, args.turns, server.base_url,
+                         args.port, args.worker_base_port)
+        for error in result["errors"][:3]:
+            print(f"  ! {error}", file=sys.stderr)
+        state = "ok" if result["consistent"] and not result["errors"] else "MISMATCH"
+        per_worker = "/".join(str(n) for n in result["per_worker"])
+        print(f"{workers:>7} {result['throughput']:>8.2f} {result['p50']:>7.3f}s {result['p95']:>7.3f}s  "
+              f"{per_worker:<16} {state}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
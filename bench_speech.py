@@ -0,0 +1,89 @@
+"""
+読み上げ用スクリプトのベンチマーク
+
+典型的な応答（絵文字・見出し・箇条書き・数式を含む Markdown）について、
+そのまま TTS に送った場合と speech.build_script() を通した場合の
+TTS 入力文字数と音声秒数を比較します。音声秒数はローカルスタンドインで実際に
+合成させた PCM の長さから計算します。
+
+    python bench_speech.py
+"""
+import argparse
+import json
+
+import requests
+
+import speech
+from standin import start_standin
+
+SAMPLE_REPLIES = [
+    (
+        "かけ算のヒント",
+        "いい質問だね！😊\n\n## 考え方のヒント\n1️⃣ **3×4** は「3 が 4 こ」という意味だよ。\n"
+        "2️⃣ りんごで考えてみよう 🍎🍎🍎 が 4 さら！\n\n- 1さら目: 3こ\n- 2さら目: 3こ\n- …\n\n"
+        "ここで、**たし算**について知っていますか？🤔",
+        "いい質問だね！さん かける よん は、さんが よっつ という意味だよ。たし算について知っていますか？",
+    ),
+    (
+        "分数の説明",
+        "### 分数ってなに？🍰\nケーキを **2つ** に分けたうちの **1つ** が `1/2` だよ。\n\n"
+        "| 分数 | 読み方 |\n|---|---|\n| 1/2 | 2分の1 |\n| 1/3 | 3分の1 |\n\n"
+        "1/2 + 1/4 = 3/4 みたいに、分母をそろえるとたし算できるんだ ✨\n\n"
+        "> ポイント：分母は「いくつに分けたか」、分子は「そのうちいくつか」！\n\n"
+        "ここで、**分母**と**分子**について知っていますか？",
+        "分数は、ケーキを わけた うちの いくつか を表すよ。分母と分子について知っていますか？",
+    ),
+    (
+        "途中式のチェック",
+        "途中式を見せてくれてありがとう！👏\n\n"
+        "1. $12 \\div 3 = 4$ ✅ 正解！\n2. $4 \\times 5 = 25$ ❌ ちょっと惜しい！\n\n"
+        "**ヒント**：4 を 5 回たすと、4+4+4+4+4 になるね。もう一度数えてみよう！💪\n\n"
+        "---\n"
+        "わからないところがあったら、いつでも聞いてね。次は**かけ算の九九**を一緒に練習しよう！"
+        "九九は 1のだん から 9のだん まであって、だんごとに覚えるコツがあるんだよ。"
+        "たとえば 5のだん は答えの最後が 0 か 5 になるし、9のだん は十の位と一の位をたすと 9 になるんだ。"
+        "こういう“ひみつ”を見つけると、九九はもっと楽しくなるよ！🎶",
+        "じゅうに わる さん は よん で正解！よん かける ご は もう一度数えてみよう。わからないところはいつでも聞いてね。",
+    ),
+]
+
+
+def synthesize_seconds(base_url, text):
+    """スタンドインの TTS で合成し、音声の秒数を返す"""
+    payload = {
+        "contents": [{"parts": [{"text": text}]}],
+        "generationConfig": {"responseModalities": ["AUDIO"]},
+    }
+    url = f"{base_url}v1beta/models/gemini-2.5-flash-preview-tts:generateContent"
+    result = requests.post(url, data=json.dumps(payload), headers={"Content-Type": "application/json"}).json()
+    return speech.audio_seconds(result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="読み上げ用スクリプトのベンチマーク")
+    parser.add_argument("--max-chars", type=int, default=speech.MAX_SPEECH_CHARS)
+    parser.add_argument("--show", action="store_true", help="変換後の文章を表示する")
+    args = parser.parse_args()
+
+    server = start_standin()
+    total = {"raw_chars": 0, "script_chars": 0, "raw_seconds": 0.0, "script_seconds": 0.0}
+    print(f"{'reply':<12} {'raw chars':>10} {'script':>8} {'raw audio':>10} {'script audio':>13}")
+    for name, reply, spoken_summary in SAMPLE_REPLIES:
+        script = speech.build_script(reply, spoken_summary, max_chars=args.max_chars)
+        raw_seconds = synthesize_seconds(server.base_url, reply)
+        script_seconds = synthesize_seconds(server.base_url, script)
+        total["raw_chars"] += len(reply)
+        total["script_chars"] += len(script)
+        total["raw_seconds"] += raw_seconds
+        total["script_seconds"] += script_seconds
+        print(f"{name:<12} {len(reply):>10} {len(script):>8} {raw_seconds:>9.1f}s {script_seconds:>12.1f}s")
+        if args.show:
+            print(f"  -> {script}")
+    turns = len(SAMPLE_REPLIES)
+    print(f"{'per turn':<12} {total['raw_chars'] / turns:>10.0f} {total['script_chars'] / turns:>8.0f} "
+          f"{total['raw_seconds'] / turns:>9.1f}s {total['script_seconds'] / turns:>12.1f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+起動ベンチマーク
+
+各アプリについて、従来の即時インポート (YUKKI_FAST_START=0) と高速起動モードを
+新しいプロセスで比較します。計測するのは次の3つです。
+
+- import : 初回描画までにアプリが行ったモジュールインポートの合計時間
+- paint  : 最初のスクリプト実行（初回描画）が終わるまでの時間
+- turn   : 最初の質問を送ってから応答が描画されるまでの時間（ローカルスタンドイン使用）
+
+    python bench_startup.py --app appp.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from standin import start_standin
+
+APPS = ["app.py", "appp.py", "apppp.py"]
+MODES = {"eager": "0", "fast": "1"}
+FIRST_QUESTION = "3×4はいくつ？"
+
+_MARK_START = "--yukki-bench-start--"
+_MARK_PAINT = "--yukki-bench-paint--"
+
+
+# ===============================
+# 子プロセス側（1回分の計測）
+# ===============================
+def run_child(app, prewarm_timeout):
+    from streamlit.testing.v1 import AppTest
+    import runtime
+
+    at = AppTest.from_file(app, default_timeout=120)
+    at.secrets["GEMINI_API_KEY"] = "standin"
+
+    print(_MARK_START, file=sys.stderr, flush=True)
+    start = time.perf_counter()
+    at.run()
+    paint = time.perf_counter() - start
+    print(_MARK_PAINT, file=sys.stderr, flush=True)
+
+    # 初回描画のあとユーザーが入力するまでの間にウォームアップが進む想定
+    runtime.wait_prewarm(prewarm_timeout)
+
+    start = time.perf_counter()
+    at.chat_input[0].set_value(FIRST_QUESTION).run()
+    turn = time.perf_counter() - start
+
+    print(json.dumps({
+        "paint": paint,
+        "turn": turn,
+        "prewarm": runtime.prewarm_timings(),
+        "exceptions": [str(e.value) for e in at.exception],
+    }))
+
+
+def _parse_importtime(stderr):
+    """-X importtime の出力から、初回描画までのインポート時間合計と読み込んだモジュールを返す"""
+    total_us = 0
+    modules = set()
+    counting = False
+    for line in stderr.splitlines():
+        if line == _MARK_START:
+            counting = True
+        elif line == _MARK_PAINT:
+            break
+        elif counting and line.startswith("import time:"):
+            fields = line.split("|")
+            if len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            modules.add(fields[2].strip())
+            # インデントのない行がトップレベルのインポート
+            if not fields[2].startswith("  "):
+                total_us += int(fields[1])
+    return total_us / 1e6, modules
+
+
+# ===============================
+# 親プロセス側
+# ===============================
+def measure(app, mode, base_url, prewarm_timeout):
+    env = dict(os.environ, YUKKI_FAST_START=MODES[mode], GEMINI_BASE_URL=base_url)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, "--child", "--app", app,
+         "--prewarm-timeout", str(prewarm_timeout)],
+        env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{app} ({mode}) failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["import"], modules = _parse_importtime(proc.stderr)
+    result["genai_loaded_at_paint"] = any(name.startswith("google.genai") for name in modules)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユッキー起動ベンチマーク")
+    parser.add_argument("--app", action="append", choices=APPS, help="計測するアプリ（省略時は全部）")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="スタンドインの応答遅延（秒）")
+    parser.add_argument("--prewarm-timeout", type=float, default=30.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.app[0], args.prewarm_timeout)
+        return
+
+    server = start_standin(latency=args.latency)
+    print(f"{'app':<10} {'mode':<6} {'import':>8} {'paint':>8} {'turn':>8}  genai@paint")
+    for app in args.app or APPS:
+        for mode in MODES:
+            runs = [measure(app, mode, server.base_url, args.prewarm_timeout) for _ in range(args.runs)]
+            for run in runs:
+                for error in run["exceptions"]:
+                    print(f"  ! {app} ({mode}): {error}")
+            med = {key: statistics.median(run[key] for run in runs) for key in ("import", "paint", "turn")}
+            loaded = "yes" if any(run["genai_loaded_at_paint"] for run in runs) else "no"
+            print(f"{app:<10} {mode:<6} {med['import']:>7.3f}s {med['paint']:>7.3f}s {med['turn']:>7.3f}s  {loaded}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
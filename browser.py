@@ -0,0 +1,118 @@
+"""
+ベンチマーク用のブラウザ役クライアント
+
+起動中の Streamlit サーバー（または serve.py のロードバランサー）に、ブラウザと同じく
+HTTP でページを取得してから WebSocket (/_stcore/stream) で接続し、チャット入力を送ります。
+受け取ったメッセージの実際のバイト数と要素数を数え、ブラウザと同じように
+キャッシュ可能なメッセージのハッシュを覚えて再実行のたびにサーバーへ伝えます
+（Streamlit はそれらを参照メッセージ ref_hash に置き換えて送る）。
+"""
+import time
+import urllib.request
+
+STARTUP_TIMEOUT = 60
+TURN_TIMEOUT = 120
+
+
+def wait_healthy(port, timeout=STARTUP_TIMEOUT, proc=None):
+    """サーバーが /_stcore/health に応答するまで待つ。応答しなければ False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            return False
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2).read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class BrowserSession:
+    """1つのブラウザタブとして会話を進めるクライアント"""
+
+    def __init__(self, port, sid):
+        from streamlit import config
+        from websockets.sync.client import connect
+
+        self.sid = sid
+        self.errors = []
+        self.last_run = {"bytes": 0, "elements": 0}
+        # ブラウザは maxCachedMessageAge 回の再実行で使われなかったメッセージを捨てる
+        self._max_age = config.get_option("global.maxCachedMessageAge")
+        self._cache = {}  # ハッシュ -> 最後に使った再実行の番号
+        self._runs = 0
+        # 最初のページ取得で、serve.py のロードバランサーなら固定先ワーカーの Cookie が返る
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=STARTUP_TIMEOUT) as response:
+            self.cookie = response.headers.get("Set-Cookie", "").split(";")[0]
+        self.worker = self.cookie.partition("=")[2]
+        self._ws = connect(
+            f"ws://127.0.0.1:{port}/_stcore/stream",
+            subprotocols=["streamlit"],
+            additional_headers={"Cookie": self.cookie} if self.cookie else None,
+            max_size=None,
+        )
+        self._chat_input_id = None
+
+    def _receive(self, reply):
+        """受け取ったメッセージをブラウザのキャッシュに反映し、要素なら True"""
+        kind = reply.WhichOneof("type")
+        if kind == "ref_hash":
+            self._cache[reply.ref_hash] = self._runs
+            return True
+        if reply.metadata.cacheable:
+            self._cache[reply.hash] = self._runs
+        if kind != "delta":
+            return False
+        if reply.delta.WhichOneof("type") == "new_element":
+            element = reply.delta.new_element
+            if element.WhichOneof("type") == "chat_input":
+                self._chat_input_id = element.chat_input.id
+            elif element.WhichOneof("type") == "exception":
+                self.errors.append(element.exception.message)
+        return True
+
+    def _finish_script_run(self):
+        self._runs += 1
+        for digest, last_used in list(self._cache.items()):
+            if self._runs - last_used > self._max_age:
+                del self._cache[digest]
+
+    def _rerun(self, widgets=()):
+        """再実行を要求し、st.rerun() による再実行も含めてスクリプトが終わるまで待つ"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = f"sid={self.sid}"
+        msg.rerun_script.widget_states.widgets.extend(widgets)
+        msg.rerun_script.cached_message_hashes.extend(self._cache)
+        self._ws.send(msg.SerializeToString())
+        self.last_run = {"bytes": 0, "elements": 0}
+        while True:
+            data = self._ws.recv(timeout=TURN_TIMEOUT)
+            reply = ForwardMsg()
+            reply.ParseFromString(data)
+            self.last_run["bytes"] += len(data)
+            self.last_run["elements"] += self._receive(reply)
+            if reply.WhichOneof("type") == "script_finished":
+                self._finish_script_run()
+                if reply.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    return
+
+    def open(self):
+        """初回表示"""
+        self._rerun()
+
+    def send(self, text):
+        """チャット入力に text を送信し、応答の表示が終わるまでの秒数を返す"""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget = WidgetState(id=self._chat_input_id)
+        widget.chat_input_value.data = text
+        start = time.perf_counter()
+        self._rerun([widget])
+        return time.perf_counter() - start
+
+    def close(self):
+        self._ws.close()
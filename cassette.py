@@ -0,0 +1,225 @@
+"""
+API 呼び出しの記録・再生 (カセット)
+
+google.genai のチャット呼び出し (httpx) と TTS の requests.Session の下に差し込む
+トランスポートです。記録モードでは実際のやり取り（応答本文・PCM 音声を含む）と所要時間を
+リクエスト内容のハッシュをキーにしたファイルへ保存し、再生モードではネットワークに出ずに
+同じ応答を返します。
+
+- YUKKI_CASSETTE=record: 実際に送信し、やり取りを YUKKI_CASSETTE_DIR に保存する
+- YUKKI_CASSETTE=replay: 保存済みのやり取りを返す（見つからなければ CassetteMiss）
+- YUKKI_REPLAY_LATENCY: 再生時の遅延。recorded（既定）で記録時の所要時間、
+  数値ならその秒数を毎回待つ（0 で待たない）
+
+キーには API キー（クエリの key やヘッダー）を含めず、カセットにも保存しません。
+"""
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# ===============================
+# 設定
+# ===============================
+MODE = os.environ.get("YUKKI_CASSETTE", "")
+CASSETTE_DIR = os.environ.get("YUKKI_CASSETTE_DIR", "cassettes")
+REPLAY_LATENCY = os.environ.get("YUKKI_REPLAY_LATENCY", "recorded")
+# 応答の再現に必要なヘッダー（content-encoding などは復号済みの本文と矛盾するので残さない）
+_KEPT_HEADERS = ("content-type",)
+_SECRET_PARAMS = ("key",)
+
+_stats_lock = threading.Lock()
+_stats = {"exchanges": 0, "misses": 0, "network_seconds": 0.0}
+
+
+class CassetteMiss(LookupError):
+    """再生モードで、リクエストに対応する記録が見つからない"""
+
+
+def is_active():
+    return MODE in ("record", "replay")
+
+
+# ===============================
+# キーと保存形式
+# ===============================
+def _normalize_url(url):
+    """ホストと API キーを除いたパス + クエリ"""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k not in _SECRET_PARAMS]
+    return parts.path + ("?" + urlencode(sorted(query)) if query else "")
+
+
+def _normalize_body(body):
+    if not body:
+        return ""
+    if isinstance(body, bytes):
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(body).decode("ascii")
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        return body
+
+
+def request_key(method, url, body):
+    """リクエスト内容（メソッド・パス・本文）のハッシュ"""
+    canonical = "\n".join((method.upper(), _normalize_url(url), _normalize_body(body)))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _path(key, directory=None):
+    return os.path.join(directory or CASSETTE_DIR, key[:2], key + ".json")
+
+
+def _encode_body(content):
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_body(response):
+    if "body_b64" in response:
+        return base64.b64decode(response["body_b64"])
+    return response.get("body", "").encode("utf-8")
+
+
+def save(method, url, body, status, headers, content, elapsed):
+    """やり取りを1ファイルとして保存する（同時に書き込んでも壊れないよう置き換えで書く）"""
+    key = request_key(method, url, body)
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    exchange = {
+        "request": {"method": method.upper(), "path": _normalize_url(url), "body": _normalize_body(body)},
+        "response": {
+            "status": status,
+            "headers": {k: v for k, v in headers.items() if k.lower() in _KEPT_HEADERS},
+            **_encode_body(content),
+        },
+        "elapsed": elapsed,
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+    }
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(exchange, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return key
+
+
+def load(method, url, body):
+    """保存済みのやり取りを返す。なければ CassetteMiss"""
+    key = request_key(method, url, body)
+    try:
+        with open(_path(key), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise CassetteMiss(f"No recording for {method.upper()} {_normalize_url(url)} ({key[:12]})") from None
+
+
+def _replay_delay(exchange):
+    if REPLAY_LATENCY == "recorded":
+        return exchange["elapsed"]
+    return float(REPLAY_LATENCY)
+
+
+def _count(seconds):
+    with _stats_lock:
+        _stats["exchanges"] += 1
+        _stats["network_seconds"] += seconds
+
+
+def stats():
+    """このプロセスでトランスポートを通ったやり取りの件数・再生できなかった件数・待ち時間（秒）の合計"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _exchange(method, url, body, send):
+    """記録 / 再生の共通処理。(status, headers, content) を返す"""
+    start = time.perf_counter()
+    if MODE == "replay":
+        try:
+            exchange = load(method, url, body)
+        except CassetteMiss:
+            with _stats_lock:
+                _stats["misses"] += 1
+            raise
+        time.sleep(_replay_delay(exchange))
+        response = exchange["response"]
+        result = response["status"], response["headers"], _decode_body(response)
+    else:
+        result = send()
+        save(method, url, body, *result, elapsed=time.perf_counter() - start)
+    _count(time.perf_counter() - start)
+    return result
+
+
+# ===============================
+# google.genai (httpx) 用トランスポート
+# ===============================
+def httpx_transport():
+    """genai.Client の http_options["client_args"]["transport"] に渡すトランスポート"""
+    import httpx
+
+    class CassetteTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._inner = httpx.HTTPTransport() if MODE == "record" else None
+
+        def handle_request(self, request):
+            body = request.read()
+
+            def send():
+                response = self._inner.handle_request(request)
+                try:
+                    content = response.read()
+                finally:
+                    response.close()
+                return response.status_code, dict(response.headers), content
+
+            status, headers, content = _exchange(request.method, str(request.url), body, send)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+
+        def close(self):
+            if self._inner is not None:
+                self._inner.close()
+
+    return CassetteTransport()
+
+
+# ===============================
+# requests (TTS) 用アダプター
+# ===============================
+def mount(session):
+    """requests.Session の http / https をカセット経由にする"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+
+    class CassetteAdapter(HTTPAdapter):
+        def send(self, request, **kwargs):
+            def send_real():
+                response = super(CassetteAdapter, self).send(request, **kwargs)
+                return response.status_code, dict(response.headers), response.content
+
+            status, headers, content = _exchange(request.method, request.url, request.body, send_real)
+            response = requests.Response()
+            response.status_code = status
+            response.headers = CaseInsensitiveDict(headers)
+            response._content = content
+            response.encoding = "utf-8"
+            response.url = request.url
+            response.request = request
+            return response
+
+    adapter = CassetteAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
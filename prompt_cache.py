@@ -0,0 +1,252 @@
+"""
+プロンプト前置きのコンテキストキャッシュ
+
+毎ターン送り直している固定の SYSTEM_PROMPT と、長い会話の前半（変わらない部分）を
+Gemini のコンテキストキャッシュ (client.caches) に登録し、チャットからは
+cached_content で参照します。
+
+- システムプロンプトだけのキャッシュは、同じモデル・同じプロンプトの全セッションで共有
+- 会話の前半は、キャッシュ外の履歴がキャッシュ済みの前半と同じ大きさ（最低
+  CONVERSATION_CACHE_STEP_TOKENS）に育つたびに、その会話用のキャッシュとして作り直す。
+  作り直す間隔を倍々に広げるので、作成時に課金されるトークンは会話の長さのおよそ2倍までに収まる
+- キャッシュの記録 (名前・有効期限) は state_store の共有キャッシュに置くので、
+  マルチワーカー構成でも同じキャッシュを使い回す。期限が近づいたら TTL を延長する
+- 作成できない（短すぎる・未対応・エラー）ときや、送信時にキャッシュが見つからないときは
+  通常どおりプロンプト全体を送る
+
+YUKKI_PROMPT_CACHE=0 で無効になります。
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+import state_store
+
+# ===============================
+# 設定
+# ===============================
+ENABLED = os.environ.get("YUKKI_PROMPT_CACHE", "1") != "0"
+CACHE_TTL_SECONDS = int(os.environ.get("YUKKI_PROMPT_CACHE_TTL", "3600"))
+REFRESH_MARGIN_SECONDS = 300  # 期限までこれより短くなったら TTL を延長する
+FAILURE_BACKOFF_SECONDS = 600  # 作成に失敗したキーは、しばらく作成を試みない
+MIN_CACHE_TOKENS = 1024  # gemini-2.5-flash でキャッシュできる最小トークン数
+CONVERSATION_CACHE_STEP_TOKENS = 1024  # 会話キャッシュを作り直すキャッシュ外の履歴の最小トークン数
+CACHED_TOKEN_RATE = 0.25  # キャッシュ済みトークンの課金率（通常の入力トークン比）
+IMAGE_TOKENS = 258
+# cached_content と一緒にリクエストへ入れられない設定（キャッシュ側に含める）
+_CACHED_FIELDS = ("system_instruction", "tools", "tool_config")
+_NAMESPACE = "prompt_cache"
+
+_key_locks = {}  # キー -> [ロック, 使用中の呼び出し数]
+_key_locks_lock = threading.Lock()
+
+
+def estimate_tokens(contents, system_instruction=""):
+    """Content のリスト（とシステムプロンプト）のおおよそのトークン数（日本語はおよそ2文字で1トークン）"""
+    chars, tokens = len(system_instruction or ""), 0
+    for content in contents:
+        for part in content.parts or []:
+            if part.text:
+                chars += len(part.text)
+            elif part.inline_data or part.file_data:
+                tokens += IMAGE_TOKENS
+    return tokens + chars // 2
+
+
+@contextlib.contextmanager
+def _locked(key):
+    """キーごとのロックを取る。記録は state_store にあるので、使い終わったロックは残さない"""
+    with _key_locks_lock:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[key]
+
+
+# ===============================
+# キャッシュ記録の管理
+# ===============================
+def _load(key):
+    raw = state_store.cache_get(_NAMESPACE, key)
+    return json.loads(raw) if raw else None
+
+
+def _store(key, record, ttl):
+    state_store.cache_put(_NAMESPACE, key, json.dumps(record), ttl=ttl)
+
+
+def _refresh(client, key, record):
+    """期限が近ければ TTL を延長する。延長できなければ None"""
+    now = time.time()
+    if record["expires_at"] - now > REFRESH_MARGIN_SECONDS:
+        return record
+    try:
+        client.caches.update(name=record["name"], config={"ttl": f"{CACHE_TTL_SECONDS}s"})
+    except Exception as e:
+        print(f"Prompt cache refresh failed ({record['name']}): {e}")
+        state_store.cache_delete(_NAMESPACE, key)
+        return None
+    record = dict(record, expires_at=now + CACHE_TTL_SECONDS)
+    _store(key, record, CACHE_TTL_SECONDS)
+    return record
+
+
+def _create(client, key, model, system_instruction, contents):
+    """キャッシュを作成して記録する。作成できなければ失敗を記録して None"""
+    now = time.time()
+    try:
+        cache = client.caches.create(model=model, config={
+            "system_instruction": system_instruction,
+            "contents": contents or None,
+            "ttl": f"{CACHE_TTL_SECONDS}s",
+            "display_name": "yukki-prompt",
+        })
+    except Exception as e:
+        print(f"Prompt cache unavailable, sending the full prompt: {e}")
+        _store(key, {"failed_until": now + FAILURE_BACKOFF_SECONDS, "count": len(contents)}, FAILURE_BACKOFF_SECONDS)
+        return None
+    record = {
+        "name": cache.name,
+        "expires_at": now + CACHE_TTL_SECONDS,
+        "count": len(contents),
+        "tokens": estimate_tokens(contents, system_instruction),
+    }
+    _store(key, record, CACHE_TTL_SECONDS)
+    return record
+
+
+def _delete(client, name):
+    try:
+        client.caches.delete(name=name)
+    except Exception as e:
+        print(f"Prompt cache delete failed ({name}): {e}")
+
+
+def shared_prompt_cache(client, model, system_instruction):
+    """同じモデル・プロンプトの全セッションで共有するシステムプロンプトのキャッシュ"""
+    key = state_store.cache_key("system", model, system_instruction)
+    with _locked(key):
+        record = _load(key)
+        if record and record.get("name"):
+            record = _refresh(client, key, record)
+            if record:
+                return record
+        elif record and record.get("failed_until", 0) > time.time():
+            return None
+        if estimate_tokens([], system_instruction) < MIN_CACHE_TOKENS:
+            # 短すぎるプロンプトは作成しても API に断られるので試さない
+            return None
+        return _create(client, key, model, system_instruction, [])
+
+
+def conversation_cache(client, model, system_instruction, history, conversation_id):
+    """会話の前半（完了したターンまで）をまとめたキャッシュ。まだ短ければ None"""
+    key = state_store.cache_key("conversation", conversation_id, model, system_instruction)
+    complete = len(history) - len(history) % 2
+    with _locked(key):
+        record = _load(key)
+        if record and record["count"] <= complete:
+            uncached = estimate_tokens(history[record["count"]:complete])
+            step = max(CONVERSATION_CACHE_STEP_TOKENS, record.get("tokens", 0))
+            if record.get("name") and uncached < step:
+                refreshed = _refresh(client, key, record)
+                if refreshed:
+                    return refreshed
+            elif record.get("failed_until", 0) > time.time() and uncached < step:
+                return None
+        if estimate_tokens(history[:complete], system_instruction) < MIN_CACHE_TOKENS:
+            return None
+        created = _create(client, key, model, system_instruction, history[:complete])
+        if created and record and record.get("name"):
+            # 古い前半キャッシュは新しいものに含まれるので削除する
+            _delete(client, record["name"])
+        return created
+
+
+# ===============================
+# チャット
+# ===============================
+def _is_cache_error(error):
+    return getattr(error, "code", None) in (400, 403, 404) and "cache" in str(error).lower()
+
+
+def _usage_line(response, seconds):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return f"Prompt: {seconds:.2f}s"
+    prompt = usage.prompt_token_count or 0
+    cached = usage.cached_content_token_count or 0
+    billed = prompt - cached + cached * CACHED_TOKEN_RATE
+    return f"Prompt: {prompt} input tokens ({cached} cached, billed ~{billed:.0f}) in {seconds:.2f}s"
+
+
+class CachedChat:
+    """前置きをコンテキストキャッシュから参照するチャット
+
+    send_message / get_history は google.genai の Chat と同じように使える。
+    get_history() はキャッシュに入れた前半も含めた会話全体を返す。
+    """
+
+    def __init__(self, client, model, config, history, cache=None, cache_key=None):
+        self._client = client
+        self._model = model
+        self._config = dict(config)
+        self._cache_key = cache_key
+        self.cache_name = cache["name"] if cache else None
+        self._prefix = list(history[:cache["count"]]) if cache else []
+        chat_config = self._config
+        if cache:
+            chat_config = {k: v for k, v in self._config.items() if k not in _CACHED_FIELDS}
+            chat_config["cached_content"] = cache["name"]
+        self._chat = client.chats.create(model=model, config=chat_config, history=list(history[len(self._prefix):]))
+        self.last_usage = None
+
+    def get_history(self):
+        return self._prefix + list(self._chat.get_history())
+
+    def _fallback(self):
+        """キャッシュを使わない通常のチャットに切り替える"""
+        print(f"Prompt cache {self.cache_name} is gone; resending the full prompt")
+        if self._cache_key:
+            state_store.cache_delete(_NAMESPACE, self._cache_key)
+        history = self.get_history()
+        self._chat = self._client.chats.create(model=self._model, config=self._config, history=history)
+        self._prefix = []
+        self.cache_name = None
+
+    def send_message(self, message):
+        start = time.perf_counter()
+        try:
+            response = self._chat.send_message(message)
+        except Exception as e:
+            if self.cache_name is None or not _is_cache_error(e):
+                raise
+            self._fallback()
+            response = self._chat.send_message(message)
+        self.last_usage = _usage_line(response, time.perf_counter() - start)
+        print(self.last_usage)
+        return response
+
+
+def create_chat(client, model, config, history=None, conversation_id=None):
+    """履歴からチャットを作る。使えるときはコンテキストキャッシュを参照する"""
+    history = list(history or [])
+    system_instruction = config.get("system_instruction")
+    if not ENABLED or not system_instruction:
+        return CachedChat(client, model, config, history)
+    cache, key = None, None
+    if conversation_id:
+        cache = conversation_cache(client, model, system_instruction, history, conversation_id)
+        key = state_store.cache_key("conversation", conversation_id, model, system_instruction)
+    if cache is None:
+        cache = shared_prompt_cache(client, model, system_instruction)
+        key = state_store.cache_key("system", model, system_instruction)
+    return CachedChat(client, model, config, history, cache, key if cache else None)
@@ -0,0 +1,219 @@
+"""
+描画ペイロードの計測と重複送信の削減
+
+- YUKKI_RENDER_PROFILE=1: 再実行 (rerun) ごとにブラウザへ送るメッセージのバイト数と要素数を
+  アプリ内の呼び出し位置（ファイル:行）ごとに集計してログに出す。
+  ブラウザがキャッシュ済みの要素は Streamlit が参照メッセージ (ref_hash) に差し替えてから
+  送信キューに入れるので、実際に送るメッセージの大きさで数える。
+- stylesheet(): global.minCachedMessageSize 以上の <style> は従来どおり毎回 st.markdown で送り、
+  Streamlit のブラウザ側キャッシュに参照メッセージ (ref_hash) へ差し替えさせる。
+  キャッシュに載らない小さな <style> だけは、ページの <head> に1度だけ登録して以降の再実行では送らない
+  （YUKKI_RENDER_DEDUP=0 で常に st.markdown で送る）。
+  その他の変化しない HTML も、.streamlit/config.toml の global.minCachedMessageSize を下げて
+  ブラウザ側キャッシュに載せる。
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+
+import streamlit as st
+
+import runtime
+
+# 重いモジュールは初回利用時まで読み込まない（runtime.FAST_START）
+components = runtime.lazy_import("streamlit.components.v1")
+
+# ===============================
+# 設定
+# ===============================
+PROFILE = os.environ.get("YUKKI_RENDER_PROFILE", "0") == "1"
+DEDUP = os.environ.get("YUKKI_RENDER_DEDUP", "1") != "0"
+TOP_SITES = 5  # ログに出す呼び出し位置の数
+MAX_SESSIONS = 256
+MAX_REPORTS = 1000
+
+_EMITTED_KEY = "_yukki_emitted_styles"
+
+
+# ===============================
+# スタイルシート
+# ===============================
+def _injector(name, css, digest):
+    """親ページの <head> に <style> を登録・更新するスクリプト"""
+    css_js = json.dumps(css, ensure_ascii=False).replace("</", "<\\/")
+    return f"""<script>
+const doc = window.parent.document;
+let style = doc.getElementById("yukki-style-{name}");
+if (!style) {{
+    style = doc.createElement("style");
+    style.id = "yukki-style-{name}";
+    doc.head.appendChild(style);
+}}
+if (style.dataset.hash !== "{digest}") {{
+    style.textContent = {css_js};
+    style.dataset.hash = "{digest}";
+}}
+</script>"""
+
+
+def _cached_by_browser(markup):
+    """markup を送る要素が Streamlit のブラウザ側キャッシュに載る大きさか
+
+    実際のメッセージは markup より大きいので、markup だけで閾値を超えていれば必ず載る。
+    """
+    from streamlit import config
+
+    return len(markup.encode("utf-8")) >= config.get_option("global.minCachedMessageSize")
+
+
+def stylesheet(name, css):
+    """CSS をページに適用する
+
+    ブラウザ側キャッシュに載らない小さな CSS だけは、内容が変わらない限りセッションで1度だけ送る。
+    その場合は親ページの <head> に登録した <style> が以降の再実行でも効き続けるが、
+    高さ 0 の iframe (components.html, Streamlit 1.66 で非推奨) がページの読み込み後に登録するため、
+    初回表示では CSS が効く前の画面（ヘッダーやサイドバーの幅）が一瞬見え、iframe の分の余白も入る。
+    CSS が閾値以上なら、その代償を払わずにキャッシュで同じだけ削減できるので st.markdown で送る。
+    """
+    markup = f"<style>{css}</style>"
+    if not DEDUP or _cached_by_browser(markup):
+        st.markdown(markup, unsafe_allow_html=True)
+        return
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:16]
+    emitted = st.session_state.setdefault(_EMITTED_KEY, {})
+    if emitted.get(name) == digest:
+        return
+    components.html(_injector(name, css, digest), height=0, width=0)
+    emitted[name] = digest
+
+
+# ===============================
+# 描画ペイロードの計測
+# ===============================
+_lock = threading.Lock()
+_sessions = OrderedDict()
+_reports = deque(maxlen=MAX_REPORTS)
+
+
+class _RunProfile:
+    def __init__(self, session_id, script_path):
+        self.session_id = session_id
+        self.script_path = script_path
+        self.bytes = 0
+        self.elements = 0
+        self.sites = {}
+
+    def add(self, site, size, is_element):
+        self.bytes += size
+        self.elements += is_element
+        entry = self.sites.setdefault(site, [0, 0])
+        entry[0] += size
+        entry[1] += is_element
+
+    def summary(self):
+        return {
+            "session_id": self.session_id,
+            "bytes": self.bytes,
+            "elements": self.elements,
+            "sites": {site: tuple(v) for site, v in self.sites.items()},
+        }
+
+
+def _call_site(script_path):
+    """メッセージを出したアプリ側の行（ファイル名:行番号）"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if os.path.abspath(frame.f_code.co_filename) == script_path:
+            return f"{os.path.basename(script_path)}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "(streamlit)"
+
+
+def _kind(msg):
+    if msg.WhichOneof("type") != "delta":
+        return msg.WhichOneof("type")
+    delta_type = msg.delta.WhichOneof("type")
+    if delta_type == "new_element":
+        return msg.delta.new_element.WhichOneof("type")
+    return delta_type
+
+
+def _flush(state, interrupted=False):
+    run = state.pop("run", None)
+    if run is None:
+        return
+    summary = run.summary()
+    _reports.append(summary)
+    top = sorted(summary["sites"].items(), key=lambda item: -item[1][0])[:TOP_SITES]
+    breakdown = ", ".join(f"{site} {size / 1024:.1f}KB/{count}" for site, (size, count) in top)
+    note = " (rerun)" if interrupted else ""
+    print(f"Render: {summary['bytes'] / 1024:.1f} KB in {summary['elements']} elements{note} [{breakdown}]")
+
+
+def start_profile():
+    """スクリプトの先頭で呼び出し、この再実行で送るメッセージの計測を始める"""
+    if not PROFILE:
+        return
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    script_path = os.path.abspath(ctx.main_script_path)
+    with _lock:
+        state = _sessions.setdefault(ctx.session_id, {})
+        _sessions.move_to_end(ctx.session_id)
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+        # st.rerun() で途中終了した前回の実行分を出力する
+        _flush(state, interrupted=True)
+        state["run"] = _RunProfile(ctx.session_id, script_path)
+
+    if getattr(ctx._enqueue, "_yukki_profiled", False):
+        return
+    original = ctx._enqueue
+    session_id = ctx.session_id
+
+    # ctx.enqueue がキャッシュ済みの要素を ref_hash に差し替えた後に呼ばれる送信キューを包む
+    def enqueue(msg):
+        with _lock:
+            state = _sessions.get(session_id) or {}
+            run = state.get("run")
+            if run is not None:
+                site = f"{_call_site(run.script_path)} ({_kind(msg)})"
+                run.add(site, msg.ByteSize(), msg.WhichOneof("type") in ("delta", "ref_hash"))
+        original(msg)
+
+    enqueue._yukki_profiled = True
+    ctx._enqueue = enqueue
+
+
+def finish_profile():
+    """スクリプトの最後で呼び出し、この再実行の集計をログに出す"""
+    if not PROFILE:
+        return
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    with _lock:
+        state = _sessions.get(ctx.session_id)
+        if state is not None:
+            _flush(state)
+
+
+def reports():
+    """集計済みの再実行ごとの結果（古い順）"""
+    with _lock:
+        return list(_reports)
+
+
+def reset_profile():
+    """セッションごとの計測中の記録と集計結果を消す"""
+    with _lock:
+        _sessions.clear()
+        _reports.clear()
@@ -0,0 +1,194 @@
+"""
+ユッキー共通ランタイム
+
+コールドスタートを短くするための共有リソースをまとめたモジュール。
+- 重いモジュール (google.genai / requests / streamlit.components.v1) の遅延インポート
+- プロセス全体で共有する Gemini クライアントと HTTP セッション
+- アバター画像などの base64 エンコード済みアセットキャッシュ
+- サーバー起動後にバックグラウンドで行う事前ウォームアップ
+- YUKKI_CASSETTE を指定したときの API 呼び出しの記録・再生 (cassette.py)
+
+環境変数 YUKKI_FAST_START=0 で従来どおりの即時インポートに戻せます。
+"""
+import base64
+import functools
+import importlib
+import os
+import threading
+import time
+
+import cassette
+
+# ===============================
+# 設定
+# ===============================
+FAST_START = os.environ.get("YUKKI_FAST_START", "1") != "0"
+
+# Gemini API のベースURL（ローカルのスタンドインに向けるときに上書きする）
+API_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/")
+if not API_BASE_URL.endswith("/"):
+    API_BASE_URL += "/"
+
+# バックグラウンドで先読みするモジュール
+PREWARM_MODULES = ("google.genai", "streamlit.components.v1")
+PREWARM_TIMEOUT = 5
+
+
+def api_url(path):
+    """ベースURLからAPIのエンドポイントURLを組み立てる"""
+    return API_BASE_URL + path.lstrip("/")
+
+
+# ===============================
+# 遅延インポート
+# ===============================
+class _LazyModule:
+    """最初に属性へアクセスされた時点で実際にインポートするモジュールの代理オブジェクト"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "pending"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """高速起動モードでは代理オブジェクトを、そうでなければ実モジュールを返す"""
+    if not FAST_START:
+        return importlib.import_module(name)
+    return _LazyModule(name)
+
+
+# ===============================
+# 共有リソース
+# ===============================
+_client_lock = threading.Lock()
+_session_lock = threading.Lock()
+_clients = {}
+_http_session = None
+
+
+def get_client(api_key):
+    """APIキーごとに1つの Gemini クライアントをプロセス全体で共有する"""
+    if not api_key:
+        return None
+    with _client_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            from google import genai
+            http_options = {"base_url": API_BASE_URL}
+            if cassette.is_active():
+                http_options["client_args"] = {"transport": cassette.httpx_transport()}
+            client = genai.Client(api_key=api_key, http_options=http_options)
+            _clients[api_key] = client
+    return client
+
+
+def get_http_session():
+    """TTS呼び出しで接続 (TLS) を使い回すための requests.Session を返す"""
+    global _http_session
+    with _session_lock:
+        if _http_session is None:
+            import requests
+            _http_session = requests.Session()
+            if cassette.is_active():
+                cassette.mount(_http_session)
+    return _http_session
+
+
+@functools.lru_cache(maxsize=None)
+def read_asset_b64(path):
+    """画像ファイルを読み込み base64 文字列にして返す（見つからなければ FileNotFoundError）"""
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+
+# ===============================
+# 事前ウォームアップ
+# ===============================
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+_prewarm_timings = {}
+
+
+def _timed(label, func, *args):
+    start = time.perf_counter()
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"Prewarm step '{label}' failed: {e}")
+    _prewarm_timings[label] = time.perf_counter() - start
+
+
+def _connect_client(api_key):
+    """Gemini クライアント自身の httpx 接続プールに接続を張っておく
+
+    google-genai の非公開属性を使うため、構成が変わったバージョンでは接続の事前確立だけを諦める。
+    """
+    client = get_client(api_key)
+    try:
+        http = client._api_client._httpx_client
+    except AttributeError:
+        print("Prewarm step 'connect' skipped: this google-genai version has no "
+              "_api_client._httpx_client; the first turn will open the connection")
+        return
+    http.head(API_BASE_URL, timeout=PREWARM_TIMEOUT)
+
+
+def _prewarm(api_key, assets, tts):
+    modules = PREWARM_MODULES + (("requests",) if tts else ())
+    for name in modules:
+        _timed(f"import:{name}", importlib.import_module, name)
+    _timed("client", get_client, api_key)
+    for path in assets:
+        if os.path.exists(path):
+            _timed(f"asset:{path}", read_asset_b64, path)
+    if api_key:
+        # 最初のターンでTLSハンドシェイクを待たないよう、実際に使う接続プールを温めておく
+        _timed("connect", _connect_client, api_key)
+        if tts:
+            _timed("connect:tts", lambda: get_http_session().head(API_BASE_URL, timeout=PREWARM_TIMEOUT))
+
+
+def start_prewarm(api_key, assets=(), tts=False):
+    """初回描画の後に呼び出し、重い初期化をバックグラウンドスレッドで1度だけ実行する
+
+    tts=True のアプリでは TTS 用の requests.Session の接続も温める。
+    """
+    global _prewarm_thread
+    if not FAST_START:
+        return None
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(
+                target=_prewarm, args=(api_key, tuple(assets), tts), name="yukki-prewarm", daemon=True
+            )
+            _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def wait_prewarm(timeout=None):
+    """ウォームアップの完了を待つ。完了していれば True を返す"""
+    thread = _prewarm_thread
+    if thread is None:
+        return False
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def prewarm_timings():
+    """ウォームアップ各ステップの所要時間（秒）"""
+    return dict(_prewarm_timings)
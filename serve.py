@@ -0,0 +1,207 @@
+"""
+マルチワーカー起動スクリプト
+
+Streamlit サーバーを N プロセス起動し、その前段にローカルのロードバランサーを置きます。
+会話ステートと TTS キャッシュは共有 SQLite (state_store, WAL モード) に保存されるため、
+どのワーカーでも同じ会話を続けられ、ワーカーが落ちても再起動後に会話が復元されます。
+
+    python serve.py --app appp.py --workers 4 --port 8501
+
+ロードバランサーはブラウザごとにワーカーを固定します（Cookie: yukki_worker）。
+WebSocket とファイルアップロードはワーカーのメモリ上で処理されるためです。
+固定先のワーカーが応答しない場合は次のワーカーに切り替えます。
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import re
+import secrets
+import signal
+import subprocess
+import sys
+
+WORKER_COOKIE = "yukki_worker"
+RESTART_DELAY = 1.0
+_HEAD_END = b"\r\n\r\n"
+_COOKIE_PATTERN = re.compile(rb"^cookie:.*\b" + WORKER_COOKIE.encode() + rb"=(\d+)", re.IGNORECASE | re.MULTILINE)
+
+
+# ===============================
+# ワーカープロセス
+# ===============================
+class Worker:
+    """1つの Streamlit サーバープロセス"""
+
+    def __init__(self, index, app, port, env, extra_args):
+        self.index = index
+        self.app = app
+        self.port = port
+        self.env = env
+        self.extra_args = extra_args
+        self.proc = None
+
+    def start(self):
+        cmd = [
+            sys.executable, "-m", "streamlit", "run", self.app,
+            "--server.port", str(self.port),
+            "--server.address", "127.0.0.1",
+            "--server.headless", "true",
+            *self.extra_args,
+        ]
+        self.proc = subprocess.Popen(cmd, env=self.env)
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self):
+        if self.alive():
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+def worker_env(db_path):
+    """全ワーカーで共有するステート設定を環境変数に載せる"""
+    env = dict(os.environ, YUKKI_STATE_BACKEND="sqlite", YUKKI_STATE_DB=os.path.abspath(db_path))
+    # serve.py をリポジトリ外から起動しても .streamlit/config.toml と同じブラウザキャッシュ閾値にする
+    env.setdefault("STREAMLIT_GLOBAL_MIN_CACHED_MESSAGE_SIZE", "1000")
+    return env
+
+
+# ===============================
+# ロードバランサー
+# ===============================
+class LoadBalancer:
+    """Cookie でブラウザをワーカーに固定する TCP レベルのリバースプロキシ"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._round_robin = itertools.cycle(range(len(workers)))
+
+    def _candidates(self, head):
+        """リクエストヘッダーから接続先ワーカーの候補を優先順に返す"""
+        match = _COOKIE_PATTERN.search(head)
+        if match and int(match.group(1)) < len(self.workers):
+            first = int(match.group(1))
+        else:
+            first = next(self._round_robin)
+        return [(first + i) % len(self.workers) for i in range(len(self.workers))]
+
+    async def _open_backend(self, head):
+        for index in self._candidates(head):
+            worker = self.workers[index]
+            if not worker.alive():
+                continue
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", worker.port)
+                return index, reader, writer
+            except OSError:
+                continue
+        return None, None, None
+
+    async def handle(self, client_reader, client_writer):
+        try:
+            head = await client_reader.readuntil(_HEAD_END)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        index, backend_reader, backend_writer = await self._open_backend(head)
+        if backend_writer is None:
+            client_writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await client_writer.drain()
+            client_writer.close()
+            return
+
+        backend_writer.write(head)
+        pinned = _COOKIE_PATTERN.search(head)
+        sticky = None if pinned and int(pinned.group(1)) == index else index
+        await asyncio.gather(
+            self._pipe(client_reader, backend_writer),
+            self._pipe_response(backend_reader, client_writer, sticky),
+        )
+
+    async def _pipe_response(self, reader, writer, sticky):
+        """最初のレスポンスに固定先ワーカーの Cookie を付けてから転送する"""
+        if sticky is not None:
+            try:
+                head = await reader.readuntil(_HEAD_END)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                writer.close()
+                return
+            cookie = f"Set-Cookie: {WORKER_COOKIE}={sticky}; Path=/; HttpOnly; SameSite=Lax\r\n".encode()
+            writer.write(head[:-2] + cookie + b"\r\n")
+        await self._pipe(reader, writer)
+
+    @staticmethod
+    async def _pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+
+async def supervise(workers):
+    """落ちたワーカーを再起動する（会話は共有ストアから復元される）"""
+    while True:
+        await asyncio.sleep(RESTART_DELAY)
+        for worker in workers:
+            if worker.proc is not None and not worker.alive():
+                print(f"Worker {worker.index} (port {worker.port}) exited with {worker.proc.returncode}; restarting")
+                worker.start()
+
+
+async def serve(workers, host, port):
+    balancer = LoadBalancer(workers)
+    server = await asyncio.start_server(balancer.handle, host, port)
+    print(f"Load balancer listening on http://{host}:{port}/ -> {len(workers)} workers")
+    async with server:
+        await asyncio.gather(server.serve_forever(), supervise(workers))
+
+
+def start_workers(app, count, base_port, db_path, extra_args=()):
+    """ワーカーを起動して返す。Cookie 署名鍵は全ワーカーで揃える"""
+    env = worker_env(db_path)
+    env.setdefault("STREAMLIT_SERVER_COOKIE_SECRET", secrets.token_hex(32))
+    workers = [Worker(i, app, base_port + i, env, list(extra_args)) for i in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユッキーをマルチワーカーで起動する")
+    parser.add_argument("--app", default="appp.py")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8501)
+    parser.add_argument("--worker-base-port", type=int, default=8601)
+    parser.add_argument("--db", default=".yukki_state.db", help="共有ステートの SQLite ファイル")
+    args, extra_args = parser.parse_known_args()
+
+    workers = start_workers(args.app, args.workers, args.worker_base_port, args.db, extra_args)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(serve(workers, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+読み上げ用スクリプト生成
+
+画面に表示する Markdown の応答を、TTS に送る短い話し言葉に変換します。
+- 見出し・箇条書き・強調・コード・リンク・絵文字 (1️⃣ など) を取り除く
+- 数式を読み上げ形にする（例: 「3×4=12」→「さん かける よん は じゅうに」）
+- 長い応答はモデルが同じ呼び出しで返した要約 (structured output の speech) に差し替え、
+  それでも長ければ文の切れ目で打ち切る
+"""
+import base64
+import json
+import os
+import re
+
+# ===============================
+# 設定
+# ===============================
+MAX_SPEECH_CHARS = int(os.environ.get("YUKKI_MAX_SPEECH_CHARS", "200"))
+# 応答と読み上げ用要約を1回のモデル呼び出しで JSON として受け取るか
+STRUCTURED_REPLY = os.environ.get("YUKKI_SPEECH_SUMMARY", "1") != "0"
+PCM_BYTES_PER_SECOND = 24000 * 2  # Gemini TTS: 24kHz 16bit モノラル
+
+SPEECH_INSTRUCTION = f"""
+応答は必ず JSON で返してください。
+- reply: 画面に表示する本文（これまでどおりのルールで、Markdown も使えます）
+- speech: reply を声に出して読むための話し言葉。絵文字・記号・箇条書き・数式記号を使わず、
+  数式は「さん かける よん」のように読み方で書き、{MAX_SPEECH_CHARS}文字以内にまとめてください。
+"""
+
+REPLY_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "reply": {"type": "STRING"},
+        "speech": {"type": "STRING"},
+    },
+    "required": ["reply", "speech"],
+}
+
+
+def reply_config(system_prompt, **config):
+    """チャット用の config に読み上げ用要約の structured output 設定を加える"""
+    if not STRUCTURED_REPLY:
+        return {"system_instruction": system_prompt, **config}
+    return {
+        "system_instruction": system_prompt + SPEECH_INSTRUCTION,
+        "response_mime_type": "application/json",
+        "response_schema": REPLY_SCHEMA,
+        **config,
+    }
+
+
+def parse_reply(text):
+    """モデルの応答から (表示用本文, 読み上げ用要約 or None) を取り出す"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return text, None
+    if not isinstance(data, dict) or not isinstance(data.get("reply"), str):
+        return text, None
+    spoken = data.get("speech")
+    return data["reply"], spoken if isinstance(spoken, str) and spoken.strip() else None
+
+
+# ===============================
+# 数の読み
+# ===============================
+_DIGITS = ["ぜろ", "いち", "に", "さん", "よん", "ご", "ろく", "なな", "はち", "きゅう"]
+_TENS = ["", "じゅう", "にじゅう", "さんじゅう", "よんじゅう", "ごじゅう", "ろくじゅう", "ななじゅう", "はちじゅう", "きゅうじゅう"]
+_HUNDREDS = ["", "ひゃく", "にひゃく", "さんびゃく", "よんひゃく", "ごひゃく", "ろっぴゃく", "ななひゃく", "はっぴゃく", "きゅうひゃく"]
+_THOUSANDS = ["", "せん", "にせん", "さんぜん", "よんせん", "ごせん", "ろくせん", "ななせん", "はっせん", "きゅうせん"]
+_UNITS = ["", "まん", "おく", "ちょう"]
+
+
+def _read_below_10000(n):
+    ones = _DIGITS[n % 10] if n % 10 else ""
+    return _THOUSANDS[n // 1000] + _HUNDREDS[n // 100 % 10] + _TENS[n // 10 % 10] + ones
+
+
+def read_number(token):
+    """半角数字（小数・3桁区切りのカンマを含む）をひらがなの読みにする。大きすぎる数はそのまま返す"""
+    integer, _, fraction = token.replace(",", "").partition(".")
+    n = int(integer)
+    if n >= 10 ** 16:
+        return token
+    if n == 0:
+        words = _DIGITS[0]
+    else:
+        words = ""
+        for unit in range(len(_UNITS) - 1, -1, -1):
+            group = n // 10 ** (4 * unit) % 10000
+            if group:
+                words += _read_below_10000(group) + _UNITS[unit]
+    if fraction:
+        words += " てん " + " ".join(_DIGITS[int(d)] for d in fraction)
+    return words
+
+
+# ===============================
+# 数式の読み上げ
+# ===============================
+_OPERATORS = {
+    "+": "たす", "＋": "たす",
+    "-": "ひく", "−": "ひく", "－": "ひく",
+    "×": "かける", "*": "かける", "＊": "かける",
+    "÷": "わる",
+    "=": "は", "＝": "は",
+}
+_LATEX = [
+    (re.compile(r"\\frac\{([^{}]+)\}\{([^{}]+)\}"), r"\1/\2"),
+    (re.compile(r"\\times"), "×"),
+    (re.compile(r"\\div"), "÷"),
+    (re.compile(r"\\cdot"), "×"),
+    (re.compile(r"\\(?:left|right)"), ""),
+    (re.compile(r"\$+"), ""),
+]
+# 穴埋め問題の空欄（「□+3=5」）
+_PLACEHOLDERS = {"□": "しかく", "○": "まる", "◯": "まる", "△": "さんかく"}
+_MINUS = "-−－"
+# a/b は小学生向けの説明では分数として読む（わり算は ÷ で書かれる前提）。10,000 は3桁区切りの1つの数
+_OPERAND = rf"\d{{1,3}}(?:,\d{{3}})+(?:\.\d+)?|\d+/\d+|\d+(?:\.\d+)?|[{''.join(_PLACEHOLDERS)}]"
+# 式の先頭や演算子の直後の「-2」は符号として読む
+_SIGNED = rf"[{_MINUS}]?(?:{_OPERAND})"
+_OPERATOR = r"[+＋\-−－×*＊÷=＝]"
+_POWER = re.compile(rf"(\d+(?:\.\d+)?|[a-zA-Z])(?:\^2|²)")
+# 3桁区切りの数や小数の途中から始まったり途中で終わったりしないようにする
+_EXPRESSION = re.compile(rf"(?<![0-9a-zA-Z.,)])(?:{_SIGNED})(?:\s*{_OPERATOR}\s*(?:{_SIGNED}))+(?!\d|[.,]\d)")
+# 2024-10-19 のような日付は引き算ではなく「2024年10月19日」として読ませる
+_DATE = re.compile(r"(?<![\d-])(\d{4})-(\d{1,2})-(\d{1,2})(?![\d-])")
+_FIRST_TERM = re.compile(_SIGNED)
+_NEXT_TERM = re.compile(rf"\s*({_OPERATOR})\s*({_SIGNED})")
+_FRACTION = re.compile(r"(?<![\d./])\d+/\d+(?![\d./])")
+_PLACEHOLDER = re.compile(f"[{''.join(_PLACEHOLDERS)}]")
+
+
+def _read_operand(token):
+    if token[0] in _MINUS:
+        return "マイナス " + _read_operand(token[1:])
+    if token in _PLACEHOLDERS:
+        return _PLACEHOLDERS[token]
+    if "/" in token:
+        numerator, denominator = token.split("/")
+        return f"{read_number(denominator)} ぶんの {read_number(numerator)}"
+    return read_number(token) if token[0].isdigit() else token
+
+
+def _verbalize_expression(match):
+    expression = match.group(0)
+    first = _FIRST_TERM.match(expression)
+    words = [_read_operand(first.group(0))]
+    # 演算子と項は交互に並ぶので、「5-3」の「-」は符号ではなく演算子として読む
+    for term in _NEXT_TERM.finditer(expression, first.end()):
+        words += [_OPERATORS[term.group(1)], _read_operand(term.group(2))]
+    return " " + " ".join(words) + " "
+
+
+def verbalize_math(text):
+    """数式を「さん かける よん は じゅうに」のような読み方に置き換える"""
+    for pattern, repl in _LATEX:
+        text = pattern.sub(repl, text)
+    text = _DATE.sub(lambda m: f"{int(m.group(1))}年{int(m.group(2))}月{int(m.group(3))}日", text)
+    text = _POWER.sub(lambda m: f" {_read_operand(m.group(1))} の にじょう ", text)
+    text = _EXPRESSION.sub(_verbalize_expression, text)
+    text = _FRACTION.sub(lambda m: f" {_read_operand(m.group(0))} ", text)
+    return _PLACEHOLDER.sub(lambda m: f" {_PLACEHOLDERS[m.group(0)]} ", text)
+
+
+# ===============================
+# Markdown・絵文字の除去
+# ===============================
+# 行頭の「- 」を数式のマイナスとして読まないよう、箇条書きの記号は数式の変換より先に取り除く
+_BULLET = re.compile(r"^\s*(?:[-*+・●■◆]|\d+[.)])\s+", re.MULTILINE)
+_MARKUP = [
+    (re.compile(r"```.*?```", re.DOTALL), ""),
+    (re.compile(r"<[^>]+>"), ""),
+    (re.compile(r"!\[[^\]]*\]\([^)]*\)"), ""),
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),
+    (re.compile(r"`([^`]*)`"), r"\1"),
+    (re.compile(r"^\s{0,3}#{1,6}\s*", re.MULTILINE), ""),
+    (re.compile(r"^\s*>\s?", re.MULTILINE), ""),
+    (_BULLET, ""),
+    (re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})\s*$", re.MULTILINE), ""),
+    (re.compile(r"^\s*\|?(?:\s*:?-+:?\s*\|)+\s*$", re.MULTILINE), ""),
+    (re.compile(r"(\*\*|__)(.+?)\1"), r"\2"),
+    (re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])"), r"\1"),
+    (re.compile(r"~~(.+?)~~"), r"\1"),
+    (re.compile(r"[ \t]*\|[ \t]*"), "、"),
+]
+_KEYCAP = re.compile("[0-9#*]\ufe0f?\u20e3")
+_EMOJI = re.compile(
+    "[\U0001F000-\U0001FAFF\U00002600-\U000027BF\U00002B00-\U00002BFF"
+    "\u2190-\u21FF\u2300-\u23FF\u3030\u303D\u3297\u3299\uFE0F\u200D]"
+)
+_SENTENCE_END = "。！？!?"
+
+
+def strip_markup(text):
+    """Markdown・HTML・絵文字を取り除き、行を文としてつなげる"""
+    for pattern, repl in _MARKUP:
+        text = pattern.sub(repl, text)
+    text = _EMOJI.sub("", _KEYCAP.sub("", text))
+    sentences = []
+    for line in text.splitlines():
+        line = re.sub(r"[ \t\u3000]+", " ", line).strip(" 、")
+        if not line:
+            continue
+        sentences.append(line if line[-1] in _SENTENCE_END + "、" else line + "。")
+    return "".join(sentences)
+
+
+def cap_length(script, max_chars=MAX_SPEECH_CHARS):
+    """文の切れ目で max_chars 以内に切り詰める"""
+    if len(script) <= max_chars:
+        return script
+    head = script[:max_chars]
+    cut = max(head.rfind(ch) for ch in _SENTENCE_END)
+    return head[:cut + 1] if cut > 0 else head
+
+
+def to_speech_script(text):
+    """表示用の応答を読み上げ用の話し言葉に変換する（長さの制限はしない）"""
+    script = strip_markup(verbalize_math(_BULLET.sub("", text)))
+    return re.sub(r" {2,}", " ", script).replace(" 。", "。").replace(" 、", "、").strip()
+
+
+def build_script(reply, spoken_summary=None, max_chars=MAX_SPEECH_CHARS):
+    """TTS に送る文章を作る。長い応答はモデルの要約に差し替え、最後に長さを制限する"""
+    script = to_speech_script(reply)
+    if len(script) > max_chars and spoken_summary:
+        script = to_speech_script(spoken_summary)
+    return cap_length(script, max_chars)
+
+
+# ===============================
+# 計測
+# ===============================
+def audio_seconds(audio_b64):
+    """base64 の PCM 音声データの再生秒数"""
+    return len(base64.b64decode(audio_b64)) / PCM_BYTES_PER_SECOND
+
+
+def report_tts(script, audio_b64, cached=False):
+    """1ターン分の TTS 入力文字数と音声秒数をログに出す"""
+    seconds = audio_seconds(audio_b64)
+    print(f"TTS: {len(script)} chars -> {seconds:.1f}s audio{' (cache)' if cached else ''}")
+    return {"chars": len(script), "audio_seconds": seconds, "cached": cached}
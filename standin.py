@@ -0,0 +1,296 @@
+"""
+ローカル Gemini スタンドインサーバー
+
+ベンチマークやオフライン確認用に、Gemini API (generateContent / TTS) と同じ形の
+レスポンスを返す小さな HTTP サーバーです。アプリ側は GEMINI_BASE_URL をこのサーバーに
+向けるだけで、実際の API キーなしに送信〜音声生成までの流れを通せます。
+コンテキストキャッシュ (cachedContents) にも対応し、キャッシュ済みのトークンは
+usageMetadata.cachedContentTokenCount に計上して prefill の遅延から除きます。
+
+    python standin.py --port 8765 --latency 0.5 --tts-latency 1.0 --prefill-per-1k 0.2
+"""
+import argparse
+import base64
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ===============================
+# 設定
+# ===============================
+PCM_SAMPLE_RATE = 24000  # Gemini TTS と同じ 16bit モノラル PCM
+SECONDS_PER_CHAR = 0.12  # 読み上げ1文字あたりのおおよその秒数
+REPLY_TEXT = "いい質問だね！😊\n\n## 考え方\n1️⃣ **3×4** は「3 が 4 こ」という意味だよ。\n\nここで、かけ算について知っていますか？"
+SPEECH_TEXT = "いい質問だね！さん かける よん は、さんが よっつ という意味だよ。かけ算について知っていますか？"
+MIN_CACHE_TOKENS = 1024  # これより小さい内容はキャッシュを作成できない（実 API と同じ）
+
+_MODEL_PATH = re.compile(r"^/v1beta/models/(?P<model>[^:/]+):generateContent$")
+_CACHES_PATH = "/v1beta/cachedContents"
+_CACHE_PATH = re.compile(r"^/v1beta/(?P<name>cachedContents/[^/]+)$")
+
+
+def estimate_tokens(text):
+    """日本語混じりの文字列のおおよそのトークン数"""
+    return max(1, len(text) // 2)
+
+
+def _collect_text(node):
+    """リクエストJSONに含まれる text フィールドをすべて連結する"""
+    if isinstance(node, dict):
+        return "".join(_collect_text(v) if k != "text" else str(v) for k, v in node.items())
+    if isinstance(node, list):
+        return "".join(_collect_text(v) for v in node)
+    return ""
+
+
+def _error(code, status, message):
+    return {"error": {"code": code, "message": message, "status": status}}
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _parse_ttl(ttl):
+    return float(str(ttl or "3600s").rstrip("s"))
+
+
+def silent_pcm_b64(seconds):
+    """指定秒数ぶんの無音PCMを base64 で返す"""
+    return base64.b64encode(b"\x00\x00" * int(PCM_SAMPLE_RATE * seconds)).decode("ascii")
+
+
+# ===============================
+# リクエストハンドラ
+# ===============================
+class StandinHandler(BaseHTTPRequestHandler):
+    """generateContent を text / audio の両方で模倣するハンドラ"""
+
+    server_version = "YukkiStandin/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        body = self._read_json()
+        if path == _CACHES_PATH:
+            self.server.record_request(path, body)
+            self._send_json(*self.server.create_cache(body))
+            return
+        match = _MODEL_PATH.match(path)
+        if not match:
+            self._send_json(404, _error(404, "NOT_FOUND", f"Unknown path {path}"))
+            return
+        self.server.record_request(path, body)
+        modalities = (body.get("generationConfig") or {}).get("responseModalities") or []
+        if "AUDIO" in modalities:
+            self._send_json(200, self._audio_response(body))
+        else:
+            self._send_json(*self._text_response(body))
+
+    def _cache_request(self, handler):
+        match = _CACHE_PATH.match(self.path.split("?", 1)[0])
+        if not match:
+            self._send_json(404, _error(404, "NOT_FOUND", f"Unknown path {self.path}"))
+            return
+        self._send_json(*handler(match.group("name")))
+
+    def do_GET(self):
+        self._cache_request(self.server.get_cache)
+
+    def do_PATCH(self):
+        body = self._read_json()
+        self._cache_request(lambda name: self.server.update_cache(name, body))
+
+    def do_DELETE(self):
+        self._cache_request(self.server.delete_cache)
+
+    def _text_response(self, body):
+        cached_tokens = 0
+        if body.get("cachedContent"):
+            cached_tokens = self.server.cached_tokens(body["cachedContent"])
+            if cached_tokens is None:
+                return 404, _error(404, "NOT_FOUND", "CachedContent not found (or permission denied)")
+        new_tokens = estimate_tokens(_collect_text(body))
+        # キャッシュ済みの前置きは prefill し直さないので、遅延は新しく送った分だけに比例させる
+        time.sleep(self.server.latency + new_tokens / 1000 * self.server.prefill_per_1k)
+        prompt_tokens = cached_tokens + new_tokens
+        self.server.record_usage(prompt_tokens, cached_tokens)
+        reply = self.server.reply_text
+        text = reply
+        if (body.get("generationConfig") or {}).get("responseMimeType") == "application/json":
+            # structured output（表示用の本文と読み上げ用の要約）
+            text = json.dumps({"reply": reply, "speech": SPEECH_TEXT}, ensure_ascii=False)
+        usage = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": estimate_tokens(text),
+            "totalTokenCount": prompt_tokens + estimate_tokens(text),
+        }
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return 200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": usage,
+            "modelVersion": "standin",
+        }
+
+    def _audio_response(self, body):
+        text = _collect_text(body.get("contents"))
+        seconds = len(text) * SECONDS_PER_CHAR
+        # 合成時間は読み上げる長さにおおよそ比例する
+        time.sleep(self.server.tts_latency + seconds * self.server.tts_realtime_factor)
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{
+                    "inlineData": {"mimeType": f"audio/L16;codec=pcm;rate={PCM_SAMPLE_RATE}", "data": silent_pcm_b64(seconds)}
+                }]},
+                "finishReason": "STOP",
+            }],
+        }
+
+
+class StandinServer(ThreadingHTTPServer):
+    """レイテンシ設定・受信リクエスト・トークン使用量・キャッシュを持つスタンドインサーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, tts_latency=0.0, tts_realtime_factor=0.0,
+                 prefill_per_1k=0.0, reply_text=REPLY_TEXT):
+        super().__init__(address, StandinHandler)
+        self.latency = latency
+        self.tts_latency = tts_latency
+        self.tts_realtime_factor = tts_realtime_factor
+        self.prefill_per_1k = prefill_per_1k
+        self.reply_text = reply_text
+        self.requests = []
+        self.usage = []
+        self.cache_creations = []  # 作成したキャッシュのトークン数（作成時に通常の入力として課金される）
+        self.caches = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def record_request(self, path, body):
+        with self._lock:
+            self.requests.append((path, body))
+
+    def record_usage(self, prompt_tokens, cached_tokens):
+        with self._lock:
+            self.usage.append({"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens})
+
+    # ---- cachedContents ----
+    def _cache_body(self, name, cache):
+        return {
+            "name": name,
+            "model": cache["model"],
+            "displayName": cache["display_name"],
+            "expireTime": _timestamp(cache["expires_at"]),
+            "usageMetadata": {"totalTokenCount": cache["tokens"]},
+        }
+
+    def _live_cache(self, name):
+        cache = self.caches.get(name)
+        if cache is None or cache["expires_at"] < time.time():
+            self.caches.pop(name, None)
+            return None
+        return cache
+
+    def create_cache(self, body):
+        tokens = estimate_tokens(_collect_text({"s": body.get("systemInstruction"), "c": body.get("contents")}))
+        if tokens < MIN_CACHE_TOKENS:
+            return 400, _error(400, "INVALID_ARGUMENT",
+                               f"Cached content is too small. total_token_count={tokens}, min_total_token_count={MIN_CACHE_TOKENS}")
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        cache = {
+            "model": body.get("model", ""),
+            "display_name": body.get("displayName", ""),
+            "tokens": tokens,
+            "expires_at": time.time() + _parse_ttl(body.get("ttl")),
+        }
+        with self._lock:
+            self.caches[name] = cache
+            self.cache_creations.append(tokens)
+        return 200, self._cache_body(name, cache)
+
+    def get_cache(self, name):
+        with self._lock:
+            cache = self._live_cache(name)
+            if cache is None:
+                return 404, _error(404, "NOT_FOUND", "CachedContent not found (or permission denied)")
+            return 200, self._cache_body(name, cache)
+
+    def update_cache(self, name, body):
+        with self._lock:
+            cache = self._live_cache(name)
+            if cache is None:
+                return 404, _error(404, "NOT_FOUND", "CachedContent not found (or permission denied)")
+            cache["expires_at"] = time.time() + _parse_ttl(body.get("ttl"))
+            return 200, self._cache_body(name, cache)
+
+    def delete_cache(self, name):
+        with self._lock:
+            if self.caches.pop(name, None) is None:
+                return 404, _error(404, "NOT_FOUND", "CachedContent not found (or permission denied)")
+        return 200, {}
+
+    def cached_tokens(self, name):
+        """有効なキャッシュのトークン数。見つからなければ None"""
+        with self._lock:
+            cache = self._live_cache(name)
+            return cache["tokens"] if cache else None
+
+
+def start_standin(port=0, **kwargs):
+    """バックグラウンドスレッドでスタンドインサーバーを起動して返す"""
+    server = StandinServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="yukki-standin", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカル Gemini スタンドインサーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="テキスト応答の遅延（秒）")
+    parser.add_argument("--tts-latency", type=float, default=0.0, help="TTS応答の固定遅延（秒）")
+    parser.add_argument("--tts-realtime-factor", type=float, default=0.0, help="音声1秒あたりの合成時間（秒）")
+    parser.add_argument("--prefill-per-1k", type=float, default=0.0, help="キャッシュされていない入力1000トークンあたりの遅延（秒）")
+    args = parser.parse_args()
+    server = StandinServer(
+        ("127.0.0.1", args.port),
+        latency=args.latency,
+        tts_latency=args.tts_latency,
+        tts_realtime_factor=args.tts_realtime_factor,
+        prefill_per_1k=args.prefill_per_1k,
+    )
+    print(f"Gemini stand-in listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
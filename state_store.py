@@ -0,0 +1,307 @@
+"""
+会話ステートと共有キャッシュの保存先
+
+- YUKKI_STATE_BACKEND=session（既定）: 従来どおり st.session_state とプロセス内の辞書に保存
+- YUKKI_STATE_BACKEND=sqlite: WAL モードの SQLite ファイル (YUKKI_STATE_DB) に保存
+
+sqlite モードでは会話を URL の ?sid= で識別するため、複数のワーカープロセスの
+どれが次のターンを処理しても、またワーカーが再起動しても同じ会話を続けられます。
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import streamlit as st
+
+# ===============================
+# 設定
+# ===============================
+BACKEND = os.environ.get("YUKKI_STATE_BACKEND", "session")
+DB_PATH = os.environ.get("YUKKI_STATE_DB", ".yukki_state.db")
+SESSION_PARAM = "sid"
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+MEMORY_CACHE_SIZE = 256  # session モードで名前空間ごとに保持する件数の上限
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024  # 同じく名前空間ごとの合計サイズの上限（TTS音声は1件で数MB）
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    sid TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,
+    PRIMARY KEY (sid, seq)
+);
+CREATE TABLE IF NOT EXISTS conversation_state (
+    sid TEXT NOT NULL, key TEXT NOT NULL, value TEXT,
+    PRIMARY KEY (sid, key)
+);
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+
+def is_shared():
+    """会話ステートをプロセス外に保存しているか"""
+    return BACKEND == "sqlite"
+
+
+# ===============================
+# SQLite 接続（プロセスで1本）
+# ===============================
+# Streamlit は再実行ごとに新しいスレッドを使うため、スレッドごとの接続では毎回接続とスキーマ作成が走る。
+# 1本の接続をロックで順番に使い、スキーマの作成もプロセスで1度だけにする
+_conn = None
+_db_lock = threading.RLock()
+
+
+@contextlib.contextmanager
+def _db():
+    """共有の接続をロックを取った状態で使う"""
+    global _conn
+    with _db_lock:
+        if _conn is None:
+            conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            _conn = conn
+        yield _conn
+
+
+# ===============================
+# 会話ステート
+# ===============================
+class SessionConversation:
+    """st.session_state に保存する会話（1プロセス内のみ）"""
+
+    def __init__(self, state):
+        self._state = state
+        if "conversation_id" not in state:
+            state.conversation_id = uuid.uuid4().hex
+        if "messages" not in state:
+            state.messages = []
+        if "chat_history" not in state:
+            state.chat_history = []
+        if "audio_to_play" not in state:
+            state.audio_to_play = None
+
+    @property
+    def id(self):
+        return self._state.conversation_id
+
+    @property
+    def messages(self):
+        return self._state.messages
+
+    def append_message(self, role, content):
+        self._state.messages.append({"role": role, "content": content})
+
+    def load_history(self):
+        return list(self._state.chat_history)
+
+    def save_history(self, chat):
+        self._state.chat_history = list(chat.get_history())
+
+    def set_pending_audio(self, data):
+        self._state.audio_to_play = data
+
+    def pop_pending_audio(self):
+        data = self._state.audio_to_play
+        self._state.audio_to_play = None
+        return data
+
+
+class SqliteConversation:
+    """共有 SQLite に保存する会話（どのワーカーからでも続きを処理できる）"""
+
+    def __init__(self, sid):
+        self.sid = sid
+        self._messages = None
+
+    @property
+    def id(self):
+        return self.sid
+
+    @property
+    def messages(self):
+        if self._messages is None:
+            with _db() as conn:
+                rows = conn.execute(
+                    "SELECT role, content FROM messages WHERE sid = ? ORDER BY seq", (self.sid,)
+                ).fetchall()
+            self._messages = [{"role": role, "content": content} for role, content in rows]
+        return self._messages
+
+    def append_message(self, role, content):
+        with _db() as conn:
+            conn.execute(
+                "INSERT INTO messages (sid, seq, role, content) "
+                "SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ? FROM messages WHERE sid = ?",
+                (self.sid, role, content, self.sid),
+            )
+        if self._messages is not None:
+            self._messages.append({"role": role, "content": content})
+
+    def _get(self, key):
+        with _db() as conn:
+            row = conn.execute(
+                "SELECT value FROM conversation_state WHERE sid = ? AND key = ?", (self.sid, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, value):
+        with _db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO conversation_state (sid, key, value) VALUES (?, ?, ?)",
+                (self.sid, key, value),
+            )
+
+    def load_history(self):
+        """保存済みのチャット履歴を google.genai の Content のリストとして返す"""
+        from google.genai import types
+
+        raw = self._get("history")
+        if not raw:
+            return []
+        return [types.Content.model_validate_json(item) for item in json.loads(raw)]
+
+    def save_history(self, chat):
+        """チャットの履歴（画像パートを含む）を保存する"""
+        history = [content.model_dump_json(exclude_none=True) for content in chat.get_history()]
+        self._set("history", json.dumps(history))
+
+    def set_pending_audio(self, data):
+        self._set("audio_to_play", data)
+
+    def pop_pending_audio(self):
+        # 再実行のたびに呼ばれるので、音声がないときは書き込みロックを取らない。
+        # 取り出しと削除は1文で行い、2つのワーカーが同じ音声を再生しないようにする
+        if self._get("audio_to_play") is None:
+            return None
+        with _db() as conn:
+            # fetchall で文を最後まで進め、暗黙のトランザクションをすぐに終わらせる
+            rows = conn.execute(
+                "DELETE FROM conversation_state WHERE sid = ? AND key = 'audio_to_play' RETURNING value",
+                (self.sid,),
+            ).fetchall()
+        return rows[0][0] if rows else None
+
+
+def conversation():
+    """現在のブラウザセッションに対応する会話を返す"""
+    if not is_shared():
+        return SessionConversation(st.session_state)
+    sid = st.query_params.get(SESSION_PARAM)
+    if not sid:
+        # URL に会話IDを載せておけば、再接続先のワーカーでも同じ会話を復元できる
+        sid = uuid.uuid4().hex
+        st.query_params[SESSION_PARAM] = sid
+    return SqliteConversation(sid)
+
+
+# ===============================
+# 共有キャッシュ（TTS音声など）
+# ===============================
+class _MemoryStore:
+    """1つの名前空間の LRU。件数と合計サイズの両方で上限を設ける"""
+
+    def __init__(self, max_entries=MEMORY_CACHE_SIZE, max_bytes=MEMORY_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < now:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, expires_at):
+        self.pop(key)
+        if len(value) > self.max_bytes:
+            return
+        self.entries[key] = (value, expires_at)
+        self.bytes += len(value)
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (old, _) = self.entries.popitem(last=False)
+            self.bytes -= len(old)
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+
+
+# 名前空間ごとに別の LRU にして、大きな TTS 音声がプロンプトキャッシュの記録などを追い出さないようにする
+_memory_stores = {}
+_memory_lock = threading.Lock()
+
+
+def cache_key(*parts):
+    """キャッシュキーを内容のハッシュから作る"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def cache_get(namespace, key):
+    """キャッシュから値を取り出す。期限切れ・未登録なら None"""
+    now = time.time()
+    if not is_shared():
+        with _memory_lock:
+            store = _memory_stores.get(namespace)
+            return store.get(key, now) if store is not None else None
+    with _db() as conn:
+        row = conn.execute(
+            "SELECT value FROM cache WHERE namespace = ? AND key = ? AND expires_at >= ?",
+            (namespace, key, now),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def cache_put(namespace, key, value, ttl=DEFAULT_CACHE_TTL):
+    """キャッシュに値を保存する"""
+    expires_at = time.time() + ttl
+    if not is_shared():
+        with _memory_lock:
+            _memory_stores.setdefault(namespace, _MemoryStore()).put(key, value, expires_at)
+        return
+    with _db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, value, expires_at),
+        )
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+
+def cache_delete(namespace, key):
+    """キャッシュから値を削除する"""
+    if not is_shared():
+        with _memory_lock:
+            store = _memory_stores.get(namespace)
+            if store is not None:
+                store.pop(key)
+        return
+    with _db() as conn:
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+def cache_clear(namespace=None):
+    """キャッシュを空にする（namespace を指定すればその名前空間だけ）"""
+    if not is_shared():
+        with _memory_lock:
+            if namespace is None:
+                _memory_stores.clear()
+            else:
+                _memory_stores.pop(namespace, None)
+        return
+    with _db() as conn:
+        if namespace is None:
+            conn.execute("DELETE FROM cache")
+        else:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
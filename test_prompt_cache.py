@@ -0,0 +1,79 @@
+"""
+prompt_cache.py の共有システムプロンプトキャッシュのテスト（ローカルスタンドインを相手にする）
+
+    python -m pytest -q test_prompt_cache.py
+"""
+import time
+
+import pytest
+
+import prompt_cache
+import state_store
+from standin import start_standin
+
+MODEL = "gemini-2.5-flash"
+# 最小キャッシュサイズ (1024 トークン) を超える長いシステムプロンプト
+SYSTEM_PROMPT = "あなたは小学生にかけ算を教える先生です。" * 120
+
+
+@pytest.fixture
+def server():
+    server = start_standin()
+    state_store.cache_clear()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def client(server):
+    from google import genai
+
+    return genai.Client(api_key="standin", http_options={"base_url": server.base_url})
+
+
+def _key():
+    return state_store.cache_key("system", MODEL, SYSTEM_PROMPT)
+
+
+def test_shared_cache_is_created_once_and_shared(server, client):
+    first = prompt_cache.shared_prompt_cache(client, MODEL, SYSTEM_PROMPT)
+    assert first and first["name"] in server.caches
+    # 別のセッションからの呼び出しも同じキャッシュを使い、作り直さない
+    second = prompt_cache.shared_prompt_cache(client, MODEL, SYSTEM_PROMPT)
+    assert second["name"] == first["name"]
+    assert len(server.cache_creations) == 1
+
+
+def test_short_prompt_is_not_cached(server, client):
+    assert prompt_cache.shared_prompt_cache(client, MODEL, "短いプロンプト") is None
+    assert server.cache_creations == []
+
+
+def test_shared_cache_is_refreshed_near_expiry(server, client):
+    record = prompt_cache.shared_prompt_cache(client, MODEL, SYSTEM_PROMPT)
+    soon = time.time() + prompt_cache.REFRESH_MARGIN_SECONDS / 2
+    prompt_cache._store(_key(), dict(record, expires_at=soon), prompt_cache.CACHE_TTL_SECONDS)
+    server.caches[record["name"]]["expires_at"] = soon
+
+    refreshed = prompt_cache.shared_prompt_cache(client, MODEL, SYSTEM_PROMPT)
+    assert refreshed["name"] == record["name"]
+    assert refreshed["expires_at"] > soon
+    assert server.caches[record["name"]]["expires_at"] > soon
+    assert len(server.cache_creations) == 1
+
+
+def test_chat_falls_back_when_the_cache_is_gone(server, client):
+    chat = prompt_cache.create_chat(client, MODEL, {"system_instruction": SYSTEM_PROMPT})
+    assert chat.cache_name in server.caches
+    # 期限切れなどでサーバー側のキャッシュが消えていても、プロンプト全体を送り直して応答する
+    name = chat.cache_name
+    server.delete_cache(name)
+
+    response = chat.send_message("3×4はいくつ？")
+    assert response.text
+    assert chat.cache_name is None
+    assert prompt_cache._load(_key()) is None
+    # 1回目はキャッシュを参照して 404、2回目はキャッシュなしで送り直している
+    sent = [body for path, body in server.requests if path.endswith(":generateContent")]
+    assert [body.get("cachedContent") for body in sent] == [name, None]
+    assert sent[-1]["systemInstruction"]
@@ -0,0 +1,59 @@
+"""
+speech.py の読み上げ変換のテスト
+
+    python -m pytest -q test_speech.py
+"""
+import speech
+
+
+def test_expression():
+    assert speech.to_speech_script("3×4=12") == "さん かける よん は じゅうに。"
+
+
+def test_signed_operands():
+    assert speech.to_speech_script("-5 + 3 = -2") == "マイナス ご たす さん は マイナス に。"
+
+
+def test_minus_between_numbers_is_an_operator():
+    assert speech.to_speech_script("10-5=5") == "じゅう ひく ご は ご。"
+
+
+def test_bullet_is_stripped_before_math():
+    assert speech.to_speech_script("- 3×4=12") == "さん かける よん は じゅうに。"
+    assert speech.to_speech_script("1. 6 − 2 = 4") == "ろく ひく に は よん。"
+
+
+def test_placeholders():
+    assert speech.to_speech_script("□+3=5 の□は？") == "しかく たす さん は ご の しかく は？"
+    assert speech.to_speech_script("○×2=8") == "まる かける に は はち。"
+
+
+def test_fraction_and_power():
+    assert speech.to_speech_script("3/4 + 1/4 = 1") == "よん ぶんの さん たす よん ぶんの いち は いち。"
+    assert speech.to_speech_script("x²") == "x の にじょう。"
+
+
+def test_markup_and_emoji():
+    assert speech.to_speech_script("**3×4=12** だよ！1️⃣✨") == "さん かける よん は じゅうに だよ！"
+
+
+def test_thousands_separators():
+    assert speech.to_speech_script("10,000-1=9,999") == (
+        "いちまん ひく いち は きゅうせんきゅうひゃくきゅうじゅうきゅう。"
+    )
+    assert speech.to_speech_script("1,234.5+0.5=1,235") == (
+        "せんにひゃくさんじゅうよん てん ご たす ぜろ てん ご は せんにひゃくさんじゅうご。"
+    )
+
+
+def test_dates_are_not_subtraction():
+    assert speech.to_speech_script("2024-10-19 のテスト") == "2024年10月19日 のテスト。"
+    assert speech.to_speech_script("答えは 2024-01-05 です") == "答えは 2024年1月5日 です。"
+
+
+def test_read_number():
+    assert speech.read_number("0") == "ぜろ"
+    assert speech.read_number("108") == "ひゃくはち"
+    assert speech.read_number("20000") == "にまん"
+    assert speech.read_number("2.5") == "に てん ご"
+    assert speech.read_number("10,000") == "いちまん"